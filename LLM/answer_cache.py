@@ -0,0 +1,228 @@
+import json
+import logging
+import time
+import uuid
+from typing import Callable
+
+import numpy as np
+import redis.asyncio as aredis
+
+from LLM.embedding_cache import decode_vector, encode_vector
+
+logger = logging.getLogger(__name__)
+
+# KEYS: entries, order, rev; ARGV: id, запись, max_entries, ttl.
+# Номер записи — INCR ревизии; при переполнении удаляются самые старые по номеру
+STORE_SCRIPT = """
+local seq = redis.call('INCR', KEYS[3])
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], seq, ARGV[1])
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[3])
+if overflow > 0 then
+    local popped = redis.call('ZPOPMIN', KEYS[2], overflow)
+    for i = 1, #popped, 2 do
+        redis.call('HDEL', KEYS[1], popped[i])
+    end
+end
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return seq
+"""
+
+# KEYS: entries, order, rev; ARGV: последний прочитанный номер.
+# Возвращает ревизию, номер самой старой живой записи и [id, номер, запись, ...]
+# новых — всё на один момент, так что ревизия точно соответствует прочитанному
+SYNC_SCRIPT = """
+local rev = redis.call('GET', KEYS[3]) or '0'
+local oldest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')[2] or false
+local flat = {}
+local new = redis.call('ZRANGEBYSCORE', KEYS[2], '(' .. ARGV[1], '+inf', 'WITHSCORES')
+for i = 1, #new, 2 do
+    table.insert(flat, new[i])
+    table.insert(flat, new[i + 1])
+    table.insert(flat, redis.call('HGET', KEYS[1], new[i]) or '')
+end
+return {rev, oldest, flat}
+"""
+
+
+class SemanticAnswerCache:
+    """
+    Семантический кэш готовых ответов LLM.
+
+    Запись — эмбеддинг вопроса и ответ; попадание — ближайший сохранённый вопрос
+    с косинусной близостью не ниже threshold. Данные лежат в Redis-хэше,
+    привязанном к версии базы знаний: при перестройке индекса версия меняется
+    и старые ответы перестают использоваться (и удаляются).
+
+    Поиск идёт по копии матрицы в памяти процесса. Обычный lookup — один GET
+    ревизии; если она выросла, из Redis читаются только записи новее уже
+    известных (у каждой записи номер в ZSET), а вытесненные удаляются из
+    копии. Вытеснение самых старых записей при переполнении выполняется
+    на сервере вместе с записью.
+
+    Близость эмбеддингов не различает «курсы для 7 лет» и «для 12 лет»:
+    функция facets (возраст, интересы, темы вопроса) сохраняется с записью,
+    и ответ отдаётся, только если она совпадает у вопросов точно.
+    """
+
+    def __init__(
+        self,
+        client: aredis.Redis,
+        version: str,
+        threshold: float = 0.92,
+        ttl: int = 24 * 3600,
+        max_entries: int = 1000,
+        namespace: str = "answer_cache",
+        facets: Callable[[str], str] = lambda question: "",
+    ):
+        self.client = client
+        self.facets = facets
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.version = version
+        self.stats = {"hits": 0, "misses": 0}
+        self._version_checked = False
+        self._store = client.register_script(STORE_SCRIPT)
+        self._sync_script = client.register_script(SYNC_SCRIPT)
+        self._reset_local()
+
+    def _reset_local(self) -> None:
+        self._revision = 0
+        self._ids: list[str] = []
+        self._seqs = np.zeros(0, dtype=np.int64)
+        self._answers: list[str] = []
+        self._facets = np.zeros(0, dtype=object)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def _entries_key(self) -> str:
+        return f"{self.namespace}:{self.version}:entries"
+
+    @property
+    def _order_key(self) -> str:
+        return f"{self.namespace}:{self.version}:order"
+
+    @property
+    def _revision_key(self) -> str:
+        return f"{self.namespace}:{self.version}:rev"
+
+    @property
+    def _current_key(self) -> str:
+        return f"{self.namespace}:current"
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    async def _ensure_version(self) -> None:
+        """Один раз на процесс: если индекс перестроен — удаляем ответы старой версии."""
+        if self._version_checked:
+            return
+        previous = await self.client.getset(self._current_key, self.version)
+        if previous and previous != self.version:
+            await self._drop_version(previous)
+        self._version_checked = True
+
+    async def _drop_version(self, version: str) -> None:
+        await self.client.delete(
+            f"{self.namespace}:{version}:entries",
+            f"{self.namespace}:{version}:order",
+            f"{self.namespace}:{version}:rev",
+        )
+        logger.info("Answer cache for knowledge base version %s invalidated", version)
+
+    async def invalidate(self, new_version: str) -> None:
+        """Переключает кэш на новую версию базы знаний, сбрасывая старые ответы."""
+        old_version = self.version
+        self.version = new_version
+        self._reset_local()
+        await self.client.set(self._current_key, new_version)
+        if old_version != new_version:
+            await self._drop_version(old_version)
+        self._version_checked = True
+
+    async def _sync(self) -> None:
+        """Дочитывает из Redis записи, добавленные после последней синхронизации."""
+        revision = int(await self.client.get(self._revision_key) or 0)
+        if revision == self._revision:
+            return
+        if revision < self._revision:
+            # ключи истекли или удалены — читаем заново
+            self._reset_local()
+        revision, oldest, flat = await self._sync_script(
+            keys=[self._entries_key, self._order_key, self._revision_key], args=[self._revision],
+        )
+        # вытесненные записи — всё, что старше самой старой живой
+        keep = self._seqs >= int(oldest) if oldest else np.zeros(len(self._ids), dtype=bool)
+        if not keep.all():
+            self._ids = [entry_id for entry_id, kept in zip(self._ids, keep) if kept]
+            self._answers = [answer for answer, kept in zip(self._answers, keep) if kept]
+            self._facets = self._facets[keep]
+            self._seqs, self._created, self._matrix = self._seqs[keep], self._created[keep], self._matrix[keep]
+
+        ids, seqs, answers, facets, created, vectors = [], [], [], [], [], []
+        for i in range(0, len(flat), 3):
+            if not flat[i + 2]:
+                continue
+            entry = json.loads(flat[i + 2])
+            ids.append(flat[i])
+            seqs.append(int(flat[i + 1]))
+            answers.append(entry["answer"])
+            # у записей без facets совпадения не будет
+            facets.append(entry.get("facets"))
+            created.append(entry["created"])
+            vectors.append(decode_vector(entry["vector"]))
+        if vectors:
+            new_matrix = np.asarray(vectors, dtype=np.float32)
+            self._matrix = np.vstack([self._matrix, new_matrix]) if self._ids else new_matrix
+            self._ids += ids
+            self._answers += answers
+            self._facets = np.concatenate([self._facets, np.array(facets, dtype=object)])
+            self._seqs = np.concatenate([self._seqs, seqs])
+            self._created = np.concatenate([self._created, created])
+        # запись другого воркера между GET и скриптом уже прочитана — не читаем её повторно
+        self._revision = int(revision)
+
+    async def lookup(self, question: str, vector: list[float]) -> str | None:
+        """Возвращает сохранённый ответ на близкий вопрос с теми же возрастом и интересами или None."""
+        await self._ensure_version()
+        await self._sync()
+        if not self._ids:
+            self.stats["misses"] += 1
+            return None
+
+        scores = self._matrix @ self._normalize(vector)
+        # устаревшие записи не участвуют в поиске
+        scores[self._created + self.ttl <= time.time()] = -1.0
+        # другой возраст или интерес — другой ответ, как бы ни были похожи вопросы
+        scores[self._facets != self.facets(question)] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            self.stats["hits"] += 1
+            logger.debug("Answer cache hit (similarity %.3f)", scores[best])
+            return self._answers[best]
+
+        self.stats["misses"] += 1
+        return None
+
+    async def store(self, question: str, vector: list[float], answer: str) -> None:
+        """Сохраняет ответ; при переполнении вытесняет самые старые записи."""
+        await self._ensure_version()
+        entry = {
+            "question": question,
+            "answer": answer,
+            "facets": self.facets(question),
+            "vector": encode_vector(self._normalize(vector).tolist()),
+            "created": time.time(),
+        }
+        await self._store(
+            keys=[self._entries_key, self._order_key, self._revision_key],
+            args=[uuid.uuid4().hex, json.dumps(entry, ensure_ascii=False), self.max_entries, self.ttl],
+        )
@@ -0,0 +1,45 @@
+"""
+Офлайн-сборка FAISS-индекса базы знаний.
+
+    python -m LLM.build_index
+
+Собирает новую версию индекса из rag.docx и rag.yaml (пути — из конфига) и
+делает её текущей. Бот только открывает готовый индекс и при старте не ходит
+в сеть; запущенные воркеры подхватывают новую версию сами. Эмбеддинги
+неизменённых чанков берутся из предыдущей версии.
+"""
+import asyncio
+import logging
+
+from langchain_community.embeddings import GigaChatEmbeddings
+
+from config.config import create_redis, load_config
+from LLM.embedding_cache import CachedEmbeddings
+from LLM.indexer import build_incremental
+
+
+async def main():
+    config = load_config()
+    logging.basicConfig(level=logging.getLevelName(level=config.log.level), format=config.log.format)
+
+    redis_client = create_redis(config.redis)
+    embeddings = CachedEmbeddings(
+        GigaChatEmbeddings(credentials=config.giga.credentials, verify_ssl_certs=False),
+        client=redis_client,
+        ttl=config.embedding_cache.ttl,
+        lru_size=config.embedding_cache.lru_size,
+    )
+    await build_incremental(
+        config.kb.index_path,
+        config.kb.source_path,
+        config.structured.path,
+        embeddings,
+        model=embeddings.model,
+        batch_size=config.kb.embed_batch_size,
+        concurrency=config.kb.embed_concurrency,
+    )
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
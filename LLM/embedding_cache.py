@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+import redis.asyncio as aredis
+from langchain_core.embeddings import Embeddings
+
+from LLM.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация запроса: регистр и лишние пробелы не должны давать новый эмбеддинг."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def encode_vector(vector: list[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+def decode_vector(raw: str | bytes) -> list[float]:
+    return np.frombuffer(base64.b64decode(raw), dtype=np.float32).tolist()
+
+
+class LRUCache:
+    """Небольшой in-process LRU с TTL на запись."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, list[float]]] = OrderedDict()
+
+    def get(self, key: str) -> list[float] | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: list[float]) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Кэш эмбеддингов поверх любого Embeddings (у нас — GigaChatEmbeddings).
+
+    Ключ — sha256 от модели и текста. Первый уровень — LRU в памяти процесса,
+    второй — Redis с TTL (общий для всех воркеров и переживает перезапуск).
+    В сеть уходят только тексты, которых нет ни в одном из уровней, а
+    одновременные запросы одного и того же текста делят один вызов.
+    Синхронные методы (их вызывают только обёртки LangChain) Redis не
+    трогают: только LRU и сама модель.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        client: aredis.Redis,
+        ttl: int = 7 * 24 * 3600,
+        lru_size: int = 2048,
+        namespace: str = "emb",
+    ):
+        self.underlying = underlying
+        self.client = client
+        self.ttl = ttl
+        self.namespace = namespace
+        self.model = getattr(underlying, "model", None) or "Embeddings"
+        self.lru = LRUCache(lru_size, ttl)
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0}
+        self.inflight = SingleFlight("embeddings")
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(f"{self.model}\x00{text}".encode()).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def _lookup_lru(self, keys: list[str]) -> tuple[dict[int, list[float]], list[int]]:
+        found, missing = {}, []
+        for i, key in enumerate(keys):
+            vector = self.lru.get(key)
+            if vector is None:
+                missing.append(i)
+            else:
+                found[i] = vector
+        self.stats["lru_hits"] += len(found)
+        return found, missing
+
+    def _merge_redis(self, keys, found, missing, raw_values) -> list[int]:
+        still_missing = []
+        for i, raw in zip(missing, raw_values):
+            if raw is None:
+                still_missing.append(i)
+                continue
+            vector = decode_vector(raw)
+            self.lru.set(keys[i], vector)
+            found[i] = vector
+        self.stats["redis_hits"] += len(missing) - len(still_missing)
+        self.stats["misses"] += len(still_missing)
+        return still_missing
+
+    def _store(self, keys, found, missing, vectors) -> dict[str, str]:
+        to_redis = {}
+        for i, vector in zip(missing, vectors):
+            self.lru.set(keys[i], vector)
+            found[i] = vector
+            to_redis[keys[i]] = encode_vector(vector)
+        return to_redis
+
+    # ---------------- async API (запросы пользователей) ----------------
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self._aembed(texts, [self._key(t) for t in texts])
+
+    async def aembed_query(self, text: str) -> list[float]:
+        # ключ — по нормализованному тексту, в модель уходит исходный
+        key = self._key(normalize_text(text))
+        if self.lru.get(key) is not None:
+            # вектор уже в памяти — склеивать нечего
+            return (await self._aembed([text], [key]))[0]
+        return (await self.inflight.do(key, lambda: self._aembed([text], [key])))[0]
+
+    async def _aembed(self, texts: list[str], keys: list[str]) -> list[list[float]]:
+        found, missing = self._lookup_lru(keys)
+
+        if missing:
+            raw_values = await self.client.mget([keys[i] for i in missing])
+            missing = self._merge_redis(keys, found, missing, raw_values)
+
+        if missing:
+            vectors = await self.underlying.aembed_documents([texts[i] for i in missing])
+            to_redis = self._store(keys, found, missing, vectors)
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in to_redis.items():
+                    pipe.set(key, value, ex=self.ttl)
+                await pipe.execute()
+
+        logger.debug("Embedding cache stats: %s", self.stats)
+        return [found[i] for i in range(len(texts))]
+
+    # ---------------- sync API (без Redis) ----------------
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, [self._key(t) for t in texts])
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], [self._key(normalize_text(text))])[0]
+
+    def _embed(self, texts: list[str], keys: list[str]) -> list[list[float]]:
+        found, missing = self._lookup_lru(keys)
+
+        if missing:
+            self.stats["misses"] += len(missing)
+            vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            self._store(keys, found, missing, vectors)
+
+        logger.debug("Embedding cache stats: %s", self.stats)
+        return [found[i] for i in range(len(texts))]
@@ -0,0 +1,94 @@
+from typing import Callable, Sequence
+
+import redis.asyncio as redis
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# Компактная запись сообщения: "<тип>|<текст>" вместо полного message_to_dict
+_TYPE_TO_CODE = {"human": "h", "ai": "a"}
+_CODE_TO_CLASS = {"h": HumanMessage, "a": AIMessage}
+
+
+def encode_message(message: BaseMessage) -> str:
+    return f"{_TYPE_TO_CODE.get(message.type, 'h')}|{message.content}"
+
+
+def decode_message(raw: str) -> BaseMessage:
+    code, _, content = raw.partition("|")
+    return _CODE_TO_CLASS.get(code, HumanMessage)(content)
+
+
+class AsyncRedisChatMessageHistory:
+    """
+    Ограниченная история диалога в Redis на асинхронном клиенте.
+
+    На сервере хранится не больше max_messages последних сообщений в компактном
+    виде; более старые при записи сворачиваются функцией fold в сводку
+    (ключ рядом с историей). Один ход диалога — два запроса к Redis:
+    чтение (история + сводка одним pipeline) и запись (одна транзакция
+    RPUSH + LTRIM + SET сводки + EXPIRE).
+    """
+
+    def __init__(self, client: redis.Redis, session_id: str, ttl: int,
+                 max_messages: int, fold: Callable[[str, list[BaseMessage]], str] | None = None):
+        self.client = client
+        self.key = f"chat_history:{session_id}"
+        self.summary_key = f"chat_summary:{session_id}"
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.fold = fold
+        self._loaded: list[BaseMessage] | None = None
+        self._summary: str | None = None
+
+    async def _load(self) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.lrange(self.key, -self.max_messages, -1)
+            pipe.get(self.summary_key)
+            raw, summary = await pipe.execute()
+        self._loaded = [decode_message(item) for item in raw]
+        self._summary = summary or ""
+
+    async def aget_messages(self) -> list[BaseMessage]:
+        if self._loaded is None:
+            await self._load()
+        return list(self._loaded)
+
+    async def aget_summary(self) -> str:
+        if self._summary is None:
+            await self._load()
+        return self._summary
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        if self._loaded is None:
+            await self._load()
+
+        combined = self._loaded + list(messages)
+        overflow = combined[:-self.max_messages] if len(combined) > self.max_messages else []
+        summary = self._summary
+        if overflow and self.fold is not None:
+            summary = self.fold(summary, overflow)
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(self.key, *[encode_message(m) for m in messages])
+            pipe.ltrim(self.key, -self.max_messages, -1)
+            pipe.expire(self.key, self.ttl)
+            if summary:
+                pipe.set(self.summary_key, summary, ex=self.ttl)
+            await pipe.execute()
+
+        self._loaded = combined[-self.max_messages:]
+        self._summary = summary
+
+    async def aexists(self) -> bool:
+        """Есть ли у сессии сохранённая история (без чтения самих сообщений)."""
+        if self._loaded is not None:
+            return bool(self._loaded or self._summary)
+        return bool(await self.client.exists(self.key, self.summary_key))
+
+    async def acount(self) -> int:
+        return len(await self.aget_messages())
+
+    async def aclear(self) -> None:
+        await self.client.delete(self.key, self.summary_key)
+        self._loaded, self._summary = [], ""
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+# Корень индекса содержит версии и указатель на текущую:
+#   CURRENT                      — имя текущей версии (меняется атомарно)
+#   versions/<версия>/           — артефакт одной версии:
+#     index.faiss      — векторы FAISS, читаются через mmap (страницы общие для всех процессов)
+#     docstore.jsonl   — чанки: по одному JSON {"page_content", "metadata"} на строку
+#     docstore.offsets — смещения строк docstore.jsonl (int64, .npy)
+#     rag.yaml         — структурированная база, из которой собрана версия
+#     meta.json        — версия, число векторов, размерность, модель, хэши источников
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.jsonl"
+OFFSETS_FILE = "docstore.offsets"
+META_FILE = "meta.json"
+CATALOG_FILE = "rag.yaml"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+FORMAT_VERSION = 2
+
+
+class JsonlDocstore(Docstore):
+    """
+    Хранилище чанков без pickle: JSONL-файл, открытый через mmap, и массив
+    смещений строк. Документ читается по номеру (он же id в FAISS).
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, DOCSTORE_FILE), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def search(self, search: str) -> Document | str:
+        i = int(search)
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        record = json.loads(self._data[self._offsets[i]:self._offsets[i + 1]])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+def _write_atomic(path: str, write) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_index(root: str, docs: list[Document], vectors: list[list[float]], model: str,
+               catalog_path: str, sources: dict[str, str]) -> dict:
+    """
+    Сохраняет новую версию индекса в versions/<версия>. Версия — хэш векторов,
+    чанков и источников, поэтому неизменённая база даёт ту же версию.
+    Текущей версию делает set_current.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+
+    lines = [
+        json.dumps({"page_content": d.page_content, "metadata": d.metadata}, ensure_ascii=False).encode() + b"\n"
+        for d in docs
+    ]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in lines])
+
+    index_bytes = faiss.serialize_index(index).tobytes()
+    docstore_bytes = b"".join(lines)
+    digest = hashlib.sha1(index_bytes + docstore_bytes)
+    digest.update(json.dumps(sources, sort_keys=True).encode())
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": digest.hexdigest()[:12],
+        "count": len(docs),
+        "dim": int(matrix.shape[1]),
+        "model": model,
+        "sources": sources,
+    }
+
+    path = version_path(root, meta["version"])
+    if read_meta(path) is not None:
+        return meta
+    os.makedirs(path, exist_ok=True)
+    _write_atomic(os.path.join(path, INDEX_FILE), lambda f: f.write(index_bytes))
+    _write_atomic(os.path.join(path, DOCSTORE_FILE), lambda f: f.write(docstore_bytes))
+    _write_atomic(os.path.join(path, OFFSETS_FILE), lambda f: np.save(f, offsets))
+    shutil.copyfile(catalog_path, os.path.join(path, CATALOG_FILE))
+    # meta.json пишется последним: по нему видно, что артефакт собран целиком
+    _write_atomic(os.path.join(path, META_FILE), lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    return meta
+
+
+def version_path(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def current_version(root: str) -> str | None:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(root: str, version: str, keep: int = 3) -> None:
+    """Атомарно делает версию текущей и удаляет самые старые из остальных."""
+    _write_atomic(os.path.join(root, CURRENT_FILE), lambda f: f.write(version.encode()))
+
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    others = sorted(
+        (name for name in os.listdir(versions_root) if name != version),
+        key=lambda name: os.path.getmtime(os.path.join(versions_root, name)),
+    )
+    # предыдущие версии ещё могут быть открыты другими воркерами — удаляем с запасом
+    for name in others[:max(len(others) - keep + 1, 0)]:
+        shutil.rmtree(os.path.join(versions_root, name), ignore_errors=True)
+
+
+def read_meta(path: str) -> dict | None:
+    """meta.json каталога версии или None, если версия не собрана."""
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    return meta if meta.get("format") == FORMAT_VERSION else None
+
+
+def current_path(root: str) -> str:
+    version = current_version(root)
+    path = version_path(root, version) if version else None
+    if path is None or read_meta(path) is None:
+        raise FileNotFoundError(
+            f"Индекс {root} не найден или собран в старом формате. "
+            f"Соберите его командой: python -m LLM.build_index"
+        )
+    return path
+
+
+def load_index(path: str, embeddings: Embeddings) -> FAISS:
+    """
+    Открывает версию индекса без pickle: векторы FAISS отображаются в память
+    только для чтения, чанки читаются из JSONL по смещениям.
+    """
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP_IFC)
+    docstore = JsonlDocstore(path)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={i: str(i) for i in range(index.ntotal)},
+    )
+
+
+def read_chunks(path: str) -> dict[str, tuple[str, list[float]]]:
+    """Текст и вектор чанков версии по их хэшам — для повторного использования при пересборке."""
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP_IFC)
+    docstore = JsonlDocstore(path)
+    chunks = {}
+    for i in range(index.ntotal):
+        doc = docstore.search(str(i))
+        if doc.metadata.get("hash"):
+            chunks[doc.metadata["hash"]] = (doc.page_content, index.reconstruct(i).tolist())
+    return chunks
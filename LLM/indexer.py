@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from docx import Document
+from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
+
+from LLM.index_store import current_version, read_chunks, read_meta, save_index, set_current, version_path
+from LLM.retriever import annotate_chunk
+from LLM.structured import CourseCatalog
+
+logger = logging.getLogger(__name__)
+
+# Куда сообщать о ходе пересборки (например, правкой сообщения админу)
+Progress = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class IndexDiff:
+    """Итог пересборки: что изменилось относительно текущей версии."""
+    version: str
+    previous_version: str | None
+    added: int = 0
+    removed: int = 0
+    kept: int = 0
+    catalog_changed: bool = False
+    seconds: float = 0.0
+    added_preview: list[str] = field(default_factory=list)
+    removed_preview: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return self.version != self.previous_version
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def preview(text: str, length: int = 80) -> str:
+    return " ".join(text.split())[:length]
+
+
+def read_docx_text(path: str) -> str:
+    return "\n".join([p.text for p in Document(path).paragraphs])
+
+
+def validate_source(path: str) -> str:
+    """
+    Проверяет загруженный файл базы знаний (.docx или .yaml) до того, как он
+    заменит рабочий. Возвращает краткое описание, при ошибке — ValueError.
+    """
+    if path.endswith(".docx"):
+        text = read_docx_text(path)
+        if not text.strip():
+            raise ValueError("в документе нет текста")
+        return f"{len(text)} символов текста"
+    try:
+        catalog = CourseCatalog.from_file(path)
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"неверная структура каталога: {e!r}") from e
+    if not catalog.courses:
+        raise ValueError("в каталоге нет курсов (раздел COURSES)")
+    return f"{len(catalog.courses)} курсов"
+
+
+def split_source(path: str, catalog: CourseCatalog):
+    """Чанки базы знаний с хэшем текста и метаданными (возраст, курсы) для фильтров ретривера."""
+    full_text = read_docx_text(path)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    docs = splitter.create_documents([full_text])
+    for d in docs:
+        d.metadata.update(annotate_chunk(d.page_content, catalog))
+        d.metadata["hash"] = chunk_hash(d.page_content)
+    return docs
+
+
+async def embed_in_batches(embeddings: Embeddings, texts: list[str], batch_size: int, concurrency: int,
+                           progress: Progress | None = None):
+    """Эмбеддинги новых чанков: пачки по batch_size, не больше concurrency запросов одновременно."""
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def embed(batch: list[str]) -> list[list[float]]:
+        nonlocal done
+        async with semaphore:
+            vectors = await embeddings.aembed_documents(batch)
+        done += len(batch)
+        if progress is not None:
+            await progress(f"Эмбеддинги: {done} из {len(texts)}")
+        return vectors
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = await asyncio.gather(*(embed(batch) for batch in batches))
+    return [vector for batch in results for vector in batch]
+
+
+def is_built_from(root: str, source_path: str, catalog_path: str) -> bool:
+    """Собрана ли текущая версия индекса из этих rag.docx и rag.yaml (по хэшам в meta.json)."""
+    version = current_version(root)
+    meta = read_meta(version_path(root, version)) if version else None
+    return bool(meta) and meta.get("sources") == {"docx": file_hash(source_path), "yaml": file_hash(catalog_path)}
+
+
+async def build_incremental(
+    root: str,
+    source_path: str,
+    catalog_path: str,
+    embeddings: Embeddings,
+    model: str,
+    batch_size: int = 16,
+    concurrency: int = 4,
+    progress: Progress | None = None,
+) -> IndexDiff:
+    """
+    Пересобирает индекс по rag.docx и rag.yaml. Векторы неизменённых чанков
+    (по хэшу текста) берутся из текущей версии, в GigaChat уходят только новые
+    и изменённые; удалённые чанки в новую версию не попадают. Новая версия
+    становится текущей атомарной заменой указателя CURRENT.
+
+    Разбор файлов и запись индекса идут в отдельном потоке, чтобы не
+    задерживать обработку сообщений в том же event loop.
+    """
+    started = time.perf_counter()
+    previous = current_version(root)
+    previous_meta = read_meta(version_path(root, previous)) if previous else None
+    previous_chunks = await asyncio.to_thread(read_chunks, version_path(root, previous)) if previous_meta else {}
+
+    catalog = await asyncio.to_thread(CourseCatalog.from_file, catalog_path)
+    docs = await asyncio.to_thread(split_source, source_path, catalog)
+    sources = {"docx": file_hash(source_path), "yaml": file_hash(catalog_path)}
+
+    new_docs = [d for d in docs if d.metadata["hash"] not in previous_chunks]
+    # одинаковые чанки внутри документа эмбеддятся один раз
+    new_texts = list(dict.fromkeys(d.page_content for d in new_docs))
+    if progress is not None:
+        await progress(f"Фрагментов: {len(docs)}, новых или изменённых: {len(new_docs)}")
+    new_vectors = dict(zip(
+        (chunk_hash(text) for text in new_texts),
+        await embed_in_batches(embeddings, new_texts, batch_size, concurrency, progress),
+    ))
+    known = {h: vector for h, (_, vector) in previous_chunks.items()} | new_vectors
+    vectors = [known[d.metadata["hash"]] for d in docs]
+
+    current_hashes = {d.metadata["hash"] for d in docs}
+    removed = [text for h, (text, _) in previous_chunks.items() if h not in current_hashes]
+    if progress is not None:
+        await progress("Сохраняю новую версию индекса")
+    meta = await asyncio.to_thread(save_index, root, docs, vectors, model, catalog_path, sources)
+    diff = IndexDiff(
+        version=meta["version"],
+        previous_version=previous,
+        added=len(new_docs),
+        removed=len(removed),
+        kept=len(docs) - len(new_docs),
+        catalog_changed=bool(previous_meta) and previous_meta.get("sources", {}).get("yaml") != sources["yaml"],
+        added_preview=[preview(d.page_content) for d in new_docs[:5]],
+        removed_preview=[preview(text) for text in removed[:5]],
+    )
+    if diff.changed:
+        set_current(root, meta["version"])
+    diff.seconds = time.perf_counter() - started
+    logger.info(
+        "Index %s: version %s -> %s, added=%s removed=%s kept=%s catalog_changed=%s in %.1fs",
+        root, previous, diff.version, diff.added, diff.removed, diff.kept, diff.catalog_changed, diff.seconds,
+    )
+    return diff
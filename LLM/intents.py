@@ -0,0 +1,76 @@
+import logging
+
+from LLM.structured import INTEREST_KEYWORDS, WORD_PATTERN, match_keys, parse_age
+
+logger = logging.getLogger(__name__)
+
+# Интенты, на которые есть готовый ответ без LLM (основы слов, как в structured.py).
+# Порядок важен: «Привет, как записаться?» — это запись, а не приветствие.
+INTENT_KEYWORDS = {
+    'sign_up': ['запис', 'запиш', 'регис'],
+    'contacts': ['телеф', 'номер', 'конта', 'связа', 'позво', 'звони', 'почта', 'почту', 'email', 'телег'],
+    'consultation': ['консу', 'посов', 'помоч', 'помог', 'подск'],
+    # только благодарность: «понятно», «хорошо», «окей» — согласие, за ним обычно идёт вопрос
+    'thanks': ['спаси', 'благо', 'спс', 'thank'],
+    'greeting': ['приве', 'здрав', 'добры', 'добро', 'вечер', 'hello', 'салют'],
+}
+
+# Короткие слова сравниваются целиком: как префиксы они совпали бы с «деньги», «хайтек», «history»
+INTENT_WORDS = {
+    'greeting': {'утро', 'утра', 'день', 'дня', 'хай', 'hi'},
+}
+
+# Служебные слова: не меняют смысла короткой реплики
+FILLER_WORDS = {
+    'а', 'и', 'но', 'да', 'ну', 'я', 'мы', 'мне', 'нам', 'вы', 'вас', 'вам', 'у', 'к', 'с', 'на', 'в', 'по',
+    'как', 'где', 'какой', 'какая', 'какие', 'можно', 'хочу', 'хотим', 'хотели', 'бы', 'пожалуйста',
+    'ваш', 'ваша', 'ваши', 'нужна', 'нужен', 'нужно', 'это', 'вот', 'же', 'ли', 'еще', 'ещё',
+    'большое', 'очень', 'всё', 'все',
+    'курс', 'курсы', 'курсе', 'занятие', 'занятия', 'пробное', 'урок', 'школа', 'школы', 'школе',
+}
+
+# Длинные сообщения почти всегда содержат настоящий вопрос
+MAX_WORDS = 8
+# Благодарность отвечается шаблоном, только если это вся реплика
+THANKS_MAX_WORDS = 4
+
+
+def detect_intent(text: str, max_words: int = MAX_WORDS) -> str | None:
+    """
+    Интент короткой реплики, на которую есть шаблонный ответ, или None —
+    тогда сообщение уходит в LLM.
+
+    Реплика распознаётся, только если каждое её слово служебное или
+    относится к интенту. Возраст ребёнка или интересы означают вопрос
+    о курсах — такие сообщения всегда остаются за LLM.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words or len(words) > max_words:
+        return _log(None, text, 'length')
+    if parse_age(text) is not None or any(match_keys(w, INTEREST_KEYWORDS) for w in words):
+        return _log(None, text, 'course question')
+
+    found, unknown = set(), []
+    for word in words:
+        if word in FILLER_WORDS:
+            continue
+        intents = [intent for intent, stems in INTENT_KEYWORDS.items()
+                   if match_keys(word, stems) or word in INTENT_WORDS.get(intent, ())]
+        if intents:
+            found.update(intents)
+        else:
+            unknown.append(word)
+
+    if unknown:
+        return _log(None, text, f'unknown words {unknown}')
+    intent = next((intent for intent in INTENT_KEYWORDS if intent in found), None)
+    if intent == 'thanks' and ('?' in text or len(words) > THANKS_MAX_WORDS):
+        return _log(None, text, 'thanks with a question')
+    return _log(intent, text, 'keywords' if intent else 'no keywords')
+
+
+def _log(intent: str | None, text: str, reason: str) -> str | None:
+    # текст сообщения — данные пользователя, в рабочий лог не пишем
+    logger.info('Intent router: %s (%s)', intent or 'llm', reason)
+    logger.debug('Intent router: %s <- %r', intent or 'llm', text[:100])
+    return intent
@@ -1,158 +1,459 @@
 import os
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-
-from docx import Document
-from environs import Env
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable
 
+import numpy as np
 from gigachat import GigaChat
 
 from langchain_community.embeddings import GigaChatEmbeddings
-from langchain_community.vectorstores import FAISS
 
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import (
+    RunnableGenerator,
     RunnableLambda,
     RunnableParallel,
-    RunnableWithMessageHistory
 )
 
-from langchain_redis import RedisChatMessageHistory
-from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
-from redis import Redis
+import redis.asyncio as redis
+
+from config.config import load_config
+from LLM.answer_cache import SemanticAnswerCache
+from LLM.embedding_cache import CachedEmbeddings, normalize_text
+from LLM.history import AsyncRedisChatMessageHistory
+from LLM.index_store import CATALOG_FILE, current_path, current_version, load_index, read_meta
+from LLM.indexer import IndexDiff, Progress, build_incremental, is_built_from
+from LLM.prompt_builder import PromptBuilder, fold_into_summary
+from LLM.retriever import HybridRetriever
+from LLM.singleflight import SingleFlight
+from LLM.structured import CourseCatalog
 
-from lexicon.lexicon import PROMPT_LEXICON
+logger = logging.getLogger(__name__)
 
 
 # ============================================================
 # 1. ИНИЦИАЛИЗАЦИЯ GIGACHAT
 # ============================================================
 
-env = Env()
-env.read_env()
+config = load_config()
+giga_config = config.giga
 
-GIGA_KEY = env.str("GIGACHAT_KEY")
+GIGA_KEY = giga_config.credentials
 
-# клиент GigaChat (он синхронный)
+# клиент GigaChat: async-методы работают через общий пул httpx-соединений
 giga = GigaChat(
     credentials=GIGA_KEY,
-    verify_ssl_certs=False
+    verify_ssl_certs=False,
+    timeout=giga_config.timeout,
+    max_connections=giga_config.max_concurrency,
 )
 
+# ограничение числа одновременных запросов к GigaChat (задаётся в конфиге)
+giga_semaphore = asyncio.Semaphore(giga_config.max_concurrency)
+
 
-# --- async wrapper ---
-executor = ThreadPoolExecutor(max_workers=10)
 async def giga_invoke_async(prompt_text: str) -> str:
-    """Асинхронный вызов GigaChat через executor."""
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(executor, giga.chat, prompt_text)
+    """Нативный асинхронный вызов GigaChat без пула потоков."""
+    async with giga_semaphore:
+        response = await giga.achat(prompt_text)
     return response.choices[0].message.content
 
 
+async def giga_stream_async(prompts: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Потоковый вызов GigaChat: отдаёт текст ответа по мере генерации."""
+    prompt_text = "".join([chunk async for chunk in prompts])
+    async with giga_semaphore:
+        async for chunk in giga.astream(prompt_text):
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+
 # ============================================================
-# 2. ВЕКТОРНОЕ ХРАНИЛИЩЕ / ЭМБЕДДИНГИ
+# 2. АСИНХРОННЫЙ REDIS
 # ============================================================
 
-embeddings = GigaChatEmbeddings(
-    credentials=GIGA_KEY,
-    verify_ssl_certs=False
-)
+# общий клиент процесса (config.create_redis), передаётся в startup()
+redis_client: redis.Redis | None = None
 
-index_path = "LLM/faiss_db"
 
-if os.path.exists(index_path):
-    print("Загружаю существующий FAISS индекс...")
-    db = FAISS.load_local(
-        index_path,
-        embeddings,
-        allow_dangerous_deserialization=True
+def get_redis_history(session_id: str):
+    return AsyncRedisChatMessageHistory(
+        client=redis_client,
+        session_id=session_id,
+        ttl=3600,
+        max_messages=config.prompt.history_max_messages,
+        fold=lambda summary, old: fold_into_summary(
+            summary, old, knowledge.catalog, config.prompt.summary_max_tokens
+        ),
     )
-else:
-    print("Создаю новый FAISS индекс...")
-
-    doc = Document("LLM/rag.docx")
-    full_text = "\n".join([p.text for p in doc.paragraphs])
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    docs = splitter.create_documents([full_text])
 
-    db = FAISS.from_documents(docs, embeddings)
-    db.save_local(index_path)
 
-retriever = db.as_retriever()
+async def load_history(session_id: str) -> AsyncRedisChatMessageHistory:
+    """История диалога, уже прочитанная из Redis (история и сводка — одним pipeline)."""
+    history = get_redis_history(session_id)
+    await history.aget_messages()
+    return history
 
 
 # ============================================================
-# 3. АСИНХРОННЫЙ REDIS
+# 3. ВЕКТОРНОЕ ХРАНИЛИЩЕ / ЭМБЕДДИНГИ
 # ============================================================
 
-redis_host = os.getenv("REDIS_HOST", "redis")
-redis_port = int(os.getenv("REDIS_PORT", 6379))
+# эмбеддинги кэшируются по хэшу текста: LRU в памяти + Redis; создаются в startup()
+embeddings: CachedEmbeddings | None = None
 
-#redis_client = Redis(host=redis_host, port=redis_port)
-redis_client = Redis(host=redis_host, port=redis_port)
 
-def get_redis_history(session_id: str):
-    return RedisChatMessageHistory(
-        redis_client=redis_client,
-        session_id=session_id,
-        ttl=3600,
-    )
+@dataclass
+class KnowledgeBase:
+    """Версия базы знаний, с которой работает бот; при обновлении заменяется целиком."""
+    version: str
+    catalog: CourseCatalog
+    retriever: HybridRetriever
 
 
+def open_knowledge_base() -> KnowledgeBase:
+    """
+    Открывает текущую версию индекса (собирается командой `python -m LLM.build_index`
+    или /reindex): векторы через mmap (общие страницы для всех воркеров), чанки из
+    JSONL, каталог курсов — rag.yaml, из которого собрана эта версия.
+    """
+    path = current_path(config.kb.index_path)
+    catalog = CourseCatalog.from_file(os.path.join(path, CATALOG_FILE))
+    db = load_index(path, embeddings)
+    # гибридный поиск: FAISS + BM25 с фильтрами по возрасту и типу курса
+    retriever = HybridRetriever(
+        db,
+        embeddings,
+        catalog,
+        k=config.retrieval.k,
+        fetch_k=config.retrieval.fetch_k,
+        rrf_k=config.retrieval.rrf_k,
+        max_distance=config.retrieval.max_distance,
+        min_lexical_score=config.retrieval.min_lexical_score,
+    )
+    return KnowledgeBase(version=read_meta(path)["version"], catalog=catalog, retriever=retriever)
 
-# 4. ПРОМПТ
 
+# открываются в startup(), а не при импорте модуля
+knowledge: KnowledgeBase | None = None
+# кэш готовых ответов на частые вопросы; сбрасывается при смене версии индекса
+answer_cache: SemanticAnswerCache | None = None
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", PROMPT_LEXICON["system_policy"]),
-    ("system", PROMPT_LEXICON["rag_guard"]),
-    ("system", PROMPT_LEXICON["assistant_template"]),
-    MessagesPlaceholder(variable_name="history"),
-    ("user", "{question}")
-])
 
+async def reload_knowledge_base() -> bool:
+    """
+    Подхватывает новую текущую версию индекса без перезапуска. Замена — одно
+    присваивание: начатые запросы дорабатывают со старой версией. Ответы,
+    закэшированные для старой версии, сбрасываются. True — база заменена.
+    """
+    global knowledge
+    if current_version(config.kb.index_path) == knowledge.version:
+        return False
+    new_knowledge = await asyncio.to_thread(open_knowledge_base)
+    old_version, knowledge = knowledge.version, new_knowledge
+    await answer_cache.invalidate(new_knowledge.version)
+    logger.info("Knowledge base swapped: %s -> %s", old_version, new_knowledge.version)
+    return True
 
 
-# 5. RAG-ЦЕПОЧКА
+# пересборка в этом процессе — по очереди; между воркерами — через блокировку в Redis
+reindex_lock = asyncio.Lock()
 
 
-def format_docs(docs):
-    return "\n\n".join(d.page_content for d in docs)
+async def reindex(progress: Progress | None = None, only_if_changed: bool = False) -> IndexDiff | None:
+    """
+    Инкрементальная пересборка индекса из rag.docx и rag.yaml и горячая замена
+    базы знаний. only_if_changed — не пересобирать, если текущая версия уже
+    собрана из этих файлов (другим воркером, пока этот ждал блокировку);
+    тогда возвращается None и версия просто подхватывается.
+    """
+    async with reindex_lock, redis_client.lock("kb:reindex:lock", timeout=600, blocking_timeout=600):
+        if only_if_changed and await asyncio.to_thread(
+            is_built_from, config.kb.index_path, config.kb.source_path, config.structured.path
+        ):
+            await reload_knowledge_base()
+            return None
+        diff = await build_incremental(
+            config.kb.index_path,
+            config.kb.source_path,
+            config.structured.path,
+            embeddings,
+            model=embeddings.model,
+            batch_size=config.kb.embed_batch_size,
+            concurrency=config.kb.embed_concurrency,
+            progress=progress,
+        )
+    await reload_knowledge_base()
+    return diff
+
+
+def _sources_mtime() -> tuple[float, float]:
+    return os.path.getmtime(config.kb.source_path), os.path.getmtime(config.structured.path)
+
+
+async def watch_knowledge_base(interval: float) -> None:
+    """
+    Фоновая задача: при изменении rag.docx/rag.yaml пересобирает индекс
+    (если включено), а новую версию, собранную другим процессом, подхватывает.
+    """
+    sources_mtime = _sources_mtime()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            mtime = _sources_mtime()
+            if config.kb.auto_reindex and mtime != sources_mtime:
+                # все воркеры видят одно изменение — собирает первый, остальные подхватывают его версию
+                await reindex(only_if_changed=True)
+                # после ошибки пересборка повторится на следующей проверке
+                sources_mtime = mtime
+            else:
+                await reload_knowledge_base()
+        except Exception:
+            logger.exception("Knowledge base update failed")
 
 
-rag_chain = (
-    RunnableParallel({
-        "question": RunnableLambda(lambda x: x["question"]),
-        "context": RunnableLambda(lambda x: retriever.invoke(x["question"]))
-                   | RunnableLambda(format_docs),
-        "history": RunnableLambda(lambda x: x.get("history", [])[-6:])
-    })
-    | prompt
-    | RunnableLambda(lambda msg: msg.to_string())
-    | RunnableLambda(lambda text: asyncio.run(giga_invoke_async(text)))
-    | StrOutputParser()
+# 4. ПРОМПТ
+
+# промпт собирается в пределах бюджета токенов (контекст и история обрезаются)
+prompt_builder = PromptBuilder(
+    max_tokens=config.prompt.max_tokens,
+    history_share=config.prompt.history_share,
 )
 
 
-# Обёртка с историей
-chain_with_history = RunnableWithMessageHistory(
-    rag_chain,
-    get_session_history=get_redis_history,
-    input_messages_key="question",
-    history_messages_key="history"
-)
+
+# 5. RAG-ЦЕПОЧКА
+
+
+async def retrieve_context(x: dict) -> list[str]:
+    """
+    Фрагменты контекста в порядке важности. Сначала — локальный разбор вопроса
+    по rag.yaml (возраст, интересы, тема); если не получилось — гибридный поиск.
+    """
+    history = x.get("history", [])
+    kb = knowledge  # версия фиксируется на весь запрос
+    if config.structured.enabled:
+        parts = kb.catalog.build_context(x["question"], history)
+        if parts is not None:
+            return parts
+    docs = await kb.retriever.ainvoke(x["question"], history)
+    return [d.page_content for d in docs]
+
+
+def assemble_prompt(x: dict) -> str:
+    prompt_text, _ = prompt_builder.build(x["question"], x["context"], x["history"], x["summary"])
+    return prompt_text
+
+
+def build_rag_chain(llm_step):
+    """Собирает RAG-цепочку с заданным шагом вызова LLM (обычным или потоковым)."""
+    return (
+        RunnableParallel({
+            "question": RunnableLambda(lambda x: x["question"]),
+            "context": RunnableLambda(retrieve_context),
+            "history": RunnableLambda(lambda x: x.get("history", [])),
+            "summary": RunnableLambda(lambda x: x.get("summary", "")),
+        })
+        | RunnableLambda(assemble_prompt)
+        | llm_step
+        | StrOutputParser()
+    )
+
+
+rag_chain = build_rag_chain(RunnableLambda(giga_invoke_async))
+rag_chain_stream = build_rag_chain(RunnableGenerator(giga_stream_async))
+
+# одинаковые вопросы новых собеседников, пришедшие одновременно, обрабатываются один раз
+inflight = SingleFlight("llm")
 
 
 
 # 6. ASYNC API ДЛЯ ТЕЛЕГРАМ-БОТА
 
-async def ask_giga_chat_async(user_question: str, session_id: str) -> str:
+def _flight_key(chain_input: dict) -> str | None:
+    """
+    Ключ для склейки одинаковых одновременных вопросов. Только для начала
+    диалога: с историей ответ зависит от беседы и общим быть не может.
+    """
+    if chain_input["history"] or chain_input["summary"]:
+        return None
+    return normalize_text(chain_input["question"])
+
+
+def question_facets(question: str) -> str:
+    """Возраст, интересы и темы вопроса (локальный разбор) — ответ из кэша должен совпасть по ним."""
+    query = knowledge.catalog.parse(question)
+    return json.dumps([query.age, sorted(query.interests), sorted(query.topics)], ensure_ascii=False)
+
+
+async def _cached_answer(chain_input: dict):
+    """
+    Проверка семантического кэша ответов.
+    Кэш используется только в начале диалога (короткая история), иначе ответ
+    зависит от контекста беседы. Возвращает (ответ или None, эмбеддинг вопроса
+    или None, если кэш неприменим).
+    """
+    if not config.answer_cache.enabled:
+        return None, None
+    if len(chain_input["history"]) > config.answer_cache.max_history:
+        return None, None
+
+    # эмбеддинг берётся из кэша эмбеддингов — ретривер потом не пойдёт в сеть повторно
+    vector = await embeddings.aembed_query(chain_input["question"])
+    return await answer_cache.lookup(chain_input["question"], vector), vector
+
+
+async def _chain_input(user_question: str, history: AsyncRedisChatMessageHistory) -> dict:
+    # история и сводка читаются из Redis одним запросом и дальше берутся из памяти
+    return {
+        "question": user_question,
+        "history": await history.aget_messages(),
+        "summary": await history.aget_summary(),
+    }
+
+
+async def _generate(chain_input: dict) -> str:
+    answer, vector = await _cached_answer(chain_input)
+    if answer is None:
+        answer = await rag_chain.ainvoke(chain_input)
+        if vector is not None and answer:
+            await answer_cache.store(chain_input["question"], vector, answer)
+    return answer
+
+
+async def _generate_stream(chain_input: dict) -> AsyncIterator[str]:
+    answer, vector = await _cached_answer(chain_input)
+    if answer is not None:
+        yield answer
+        return
+    chunks = []
+    async for chunk in rag_chain_stream.astream(chain_input):
+        chunks.append(chunk)
+        yield chunk
+    answer = "".join(chunks)
+    if vector is not None and answer:
+        await answer_cache.store(chain_input["question"], vector, answer)
+
+
+async def ask_giga_chat_async(user_question: str, session_id: str,
+                              history: AsyncRedisChatMessageHistory | None = None) -> str:
+    """
+    Асинхронная функция общения с AI. history — уже загруженная история
+    (load_history), чтобы не читать её из Redis второй раз.
+    """
+    history = history or get_redis_history(session_id)
+    chain_input = await _chain_input(user_question, history)
+    key = _flight_key(chain_input)
+    if key is None:
+        answer = await _generate(chain_input)
+    else:
+        answer = await inflight.do(f"ask:{key}", lambda: _generate(chain_input))
+
+    await history.aadd_messages([HumanMessage(user_question), AIMessage(answer)])
+    return answer
+
+
+async def stream_giga_chat_async(user_question: str, session_id: str,
+                                 history: AsyncRedisChatMessageHistory | None = None) -> AsyncIterator[str]:
+    """
+    Потоковый вариант ask_giga_chat_async: отдаёт ответ по частям.
+    История сохраняется после завершения потока.
+    """
+    history = history or get_redis_history(session_id)
+    chain_input = await _chain_input(user_question, history)
+    key = _flight_key(chain_input)
+    if key is None:
+        stream = _generate_stream(chain_input)
+    else:
+        stream = inflight.stream(f"stream:{key}", lambda: _generate_stream(chain_input))
+
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        yield chunk
+
+    await history.aadd_messages([HumanMessage(user_question), AIMessage("".join(chunks))])
+
+
+
+# 7. ЖИЗНЕННЫЙ ЦИКЛ
+
+async def startup(client: redis.Redis) -> float:
     """
-    Асинхронная функция общения с AI.
+    Подключает общий клиент Redis, открывает базу знаний и кэш ответов.
+    Вызывается до начала приёма сообщений; в сеть не ходит (индекс читается
+    с диска). Возвращает длительность, сек.
     """
-    return await chain_with_history.ainvoke(
-        {"question": user_question},
-        config={"configurable": {"session_id": session_id}}
-    )
\ No newline at end of file
+    global redis_client, embeddings, knowledge, answer_cache
+    started = time.perf_counter()
+    redis_client = client
+    embeddings = CachedEmbeddings(
+        GigaChatEmbeddings(
+            credentials=GIGA_KEY,
+            verify_ssl_certs=False
+        ),
+        client=redis_client,
+        ttl=config.embedding_cache.ttl,
+        lru_size=config.embedding_cache.lru_size,
+    )
+    knowledge = await asyncio.to_thread(open_knowledge_base)
+    answer_cache = SemanticAnswerCache(
+        client=redis_client,
+        version=knowledge.version,
+        threshold=config.answer_cache.threshold,
+        ttl=config.answer_cache.ttl,
+        max_entries=config.answer_cache.max_entries,
+        facets=question_facets,
+    )
+    elapsed = time.perf_counter() - started
+    logger.info("LLM startup: knowledge base %s opened in %.2fs", knowledge.version, elapsed)
+    return elapsed
+
+
+def _touch_index_pages() -> None:
+    # поиск по плоскому индексу проходит все векторы — страницы mmap попадают в page cache
+    index = knowledge.retriever.db.index
+    index.search(np.zeros((1, index.d), dtype=np.float32), 1)
+
+
+async def _timed(name: str, step: Awaitable) -> tuple[str, float, BaseException | None]:
+    started = time.perf_counter()
+    try:
+        await step
+    except Exception as e:
+        return name, time.perf_counter() - started, e
+    return name, time.perf_counter() - started, None
+
+
+async def warmup() -> dict[str, float]:
+    """
+    Прогрев параллельно с началом polling: OAuth-токен GigaChat, страницы
+    индекса, соединения с Redis. Ошибки не фатальны — первый запрос сделает
+    то же самое сам. Возвращает длительность каждого шага, сек.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        _timed("gigachat_token", giga.aget_token()),
+        _timed("index_pages", asyncio.to_thread(_touch_index_pages)),
+        _timed("redis", redis_client.ping()),
+    )
+    timings = {}
+    for name, elapsed, error in results:
+        timings[name] = elapsed
+        if error is not None:
+            logger.warning("Warmup step %s failed after %.2fs: %r", name, elapsed, error)
+    logger.info(
+        "LLM warmup finished in %.2fs: %s", time.perf_counter() - started,
+        ", ".join(f"{name}={elapsed:.2f}s" for name, elapsed in timings.items()),
+    )
+    return timings
+
+
+async def shutdown() -> None:
+    """Закрывает HTTP-клиент GigaChat (общий пул Redis закрывается последним, вместе с хранилищем FSM)."""
+    await giga.aclose()
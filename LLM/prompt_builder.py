@@ -0,0 +1,173 @@
+import logging
+import math
+from dataclasses import dataclass, field
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+
+from LLM.structured import WORD_PATTERN, CourseCatalog, match_keys, parse_age
+from lexicon.lexicon import PROMPT_LEXICON
+
+logger = logging.getLogger(__name__)
+
+# Для русского текста у GigaChat в среднем ~3 символа на токен; оценка с запасом
+CHARS_PER_TOKEN = 3.0
+
+FACTS_PREFIX = 'Известно:'
+
+
+def estimate_tokens(text: str) -> int:
+    """Локальная оценка числа токенов (без запроса к API)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    return cut[: cut.rfind(' ')] + '…' if ' ' in cut else cut
+
+
+def fold_into_summary(summary: str, messages: list[BaseMessage], catalog: CourseCatalog, max_tokens: int) -> str:
+    """
+    Сворачивает старые сообщения в краткое содержание диалога.
+
+    Сводка строится локально, без вызова LLM: строка с фактами (возраст,
+    интересы — словами родителя) и короткие выдержки из реплик. Старые
+    выдержки вытесняются, когда сводка выходит за max_tokens.
+    """
+    old_lines = summary.splitlines()
+    facts_line = next((line for line in old_lines if line.startswith(FACTS_PREFIX)), '')
+    lines = [line for line in old_lines if line and not line.startswith(FACTS_PREFIX)]
+
+    age = parse_age(facts_line)
+    interests = [w.strip() for w in facts_line.partition('интересы:')[2].split(',') if w.strip()]
+    for message in messages:
+        text = ' '.join(message.content.split())
+        if message.type == 'human':
+            lines.append('Родитель: ' + truncate_to_tokens(text, 40))
+            age = parse_age(text) or age
+            for word in WORD_PATTERN.findall(text.lower()):
+                if match_keys(word, catalog.by_keyword) and word not in interests:
+                    interests.append(word)
+        elif message.type == 'ai':
+            lines.append('Консультант: ' + truncate_to_tokens(text, 25))
+
+    facts = []
+    if age is not None:
+        facts.append(f'возраст ребёнка {age} лет')
+    if interests:
+        facts.append('интересы: ' + ', '.join(interests))
+    if facts:
+        facts_line = FACTS_PREFIX + ' ' + '; '.join(facts)
+
+    while lines and estimate_tokens('\n'.join([facts_line, *lines])) > max_tokens:
+        lines.pop(0)
+    return '\n'.join(line for line in [facts_line, *lines] if line)
+
+
+@dataclass
+class PromptStats:
+    """Размеры частей промпта в токенах (оценка) — для логов и метрик."""
+    system: int = 0
+    summary: int = 0
+    context: int = 0
+    history: int = 0
+    question: int = 0
+    total: int = 0
+    untrimmed: int = 0
+    dropped_chunks: int = 0
+    dropped_messages: int = 0
+
+
+@dataclass
+class PromptMetrics:
+    """Накопленная статистика по промптам процесса."""
+    requests: int = 0
+    total_tokens: int = 0
+    saved_tokens: int = 0
+    last: PromptStats = field(default_factory=PromptStats)
+
+    def add(self, stats: PromptStats) -> None:
+        self.requests += 1
+        self.total_tokens += stats.total
+        self.saved_tokens += stats.untrimmed - stats.total
+        self.last = stats
+
+
+class PromptBuilder:
+    """
+    Сборка промпта в пределах бюджета токенов.
+
+    Обязательные части — системный промпт и вопрос. Остаток бюджета делится
+    между контекстом (фрагменты идут в порядке ранжирования, лишние
+    отбрасываются, последний влезающий обрезается) и последними сообщениями
+    истории (от новых к старым). Более старая история приходит сводкой.
+    """
+
+    def __init__(self, max_tokens: int = 2000, history_share: float = 0.3, min_chunk_tokens: int = 60):
+        self.max_tokens = max_tokens
+        self.history_share = history_share
+        self.min_chunk_tokens = min_chunk_tokens
+        self.system_template = PROMPT_LEXICON['system_prompt']
+        self.system_tokens = estimate_tokens(self.system_template.replace('{context}', ''))
+        self.metrics = PromptMetrics()
+
+    def _fit_context(self, chunks: list[str], budget: int) -> tuple[list[str], int]:
+        fitted, used = [], 0
+        for chunk in chunks:
+            cost = estimate_tokens(chunk)
+            if used + cost <= budget:
+                fitted.append(chunk)
+                used += cost
+                continue
+            if budget - used >= self.min_chunk_tokens:
+                chunk = truncate_to_tokens(chunk, budget - used)
+                fitted.append(chunk)
+                used += estimate_tokens(chunk)
+            break
+        return fitted, used
+
+    @staticmethod
+    def _fit_history(history: list[BaseMessage], budget: int) -> tuple[list[BaseMessage], int]:
+        fitted, used = [], 0
+        for message in reversed(history):
+            cost = estimate_tokens(get_buffer_string([message]))
+            if used + cost > budget:
+                break
+            fitted.insert(0, message)
+            used += cost
+        return fitted, used
+
+    def build(self, question: str, chunks: list[str], history: list[BaseMessage], summary: str = '') -> tuple[str, PromptStats]:
+        stats = PromptStats(system=self.system_tokens, question=estimate_tokens(question))
+        summary_text = PROMPT_LEXICON['summary'].replace('{summary}', summary) if summary else ''
+        stats.summary = estimate_tokens(summary_text)
+
+        remaining = max(self.max_tokens - stats.system - stats.question - stats.summary, 0)
+        history_need = sum(estimate_tokens(get_buffer_string([m])) for m in history)
+        history_budget = min(history_need, int(remaining * self.history_share))
+
+        context, stats.context = self._fit_context(chunks, remaining - history_budget)
+        kept_history, stats.history = self._fit_history(history, remaining - stats.context)
+
+        stats.dropped_chunks = len(chunks) - len(context)
+        stats.dropped_messages = len(history) - len(kept_history)
+        stats.total = stats.system + stats.summary + stats.context + stats.history + stats.question
+        stats.untrimmed = (stats.system + stats.summary + stats.question + history_need
+                           + sum(estimate_tokens(chunk) for chunk in chunks))
+
+        messages = [SystemMessage(self.system_template.replace('{context}', '\n\n'.join(context)))]
+        if summary_text:
+            messages.append(SystemMessage(summary_text))
+        messages.extend(kept_history)
+        messages.append(HumanMessage(question))
+
+        self.metrics.add(stats)
+        logger.info(
+            'Prompt tokens: total=%s (untrimmed %s) system=%s summary=%s context=%s history=%s question=%s '
+            'dropped_chunks=%s dropped_messages=%s',
+            stats.total, stats.untrimmed, stats.system, stats.summary, stats.context, stats.history,
+            stats.question, stats.dropped_chunks, stats.dropped_messages,
+        )
+        return get_buffer_string(messages), stats
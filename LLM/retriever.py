@@ -0,0 +1,165 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from LLM.structured import WORD_PATTERN, CourseCatalog
+
+logger = logging.getLogger(__name__)
+
+AGE_RANGE_PATTERNS = [
+    re.compile(r'(\d{1,2})\s*[–—-]\s*(\d{1,2})\s*лет'),
+    re.compile(r'от\s*(\d{1,2})\s*до\s*(\d{1,2})'),
+]
+AGE_FROM_PATTERN = re.compile(r'(\d{1,2})\s*\+')
+
+# основа слова для лексического поиска (грубый стемминг для русского)
+LEXICAL_STEM_LEN = 6
+
+
+def tokenize(text: str) -> list[str]:
+    return [word[:LEXICAL_STEM_LEN] for word in WORD_PATTERN.findall(text.lower())]
+
+
+def annotate_chunk(text: str, catalog: CourseCatalog) -> dict:
+    """Метаданные чанка: возрастные диапазоны и упомянутые курсы."""
+    lowered = text.lower()
+    ages = [(int(a), int(b)) for pattern in AGE_RANGE_PATTERNS for a, b in pattern.findall(lowered)]
+    ages += [(int(a), 99) for a in AGE_FROM_PATTERN.findall(lowered)]
+    return {
+        'ages': ages,
+        'courses': sorted(catalog.courses_in(text)),
+    }
+
+
+class BM25Index:
+    """Инвертированный индекс BM25, посчитанный заранее по чанкам базы знаний."""
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc_id, tf))
+        n = len(texts)
+        self.avg_length = (sum(self.lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, allowed: set[int] | None = None) -> list[tuple[int, float]]:
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    """
+    Гибридный поиск по чанкам базы знаний: FAISS (векторы) + BM25 (слова),
+    результаты объединяются reciprocal rank fusion.
+
+    Фильтры по возрасту и типу курса применяются до подсчёта оценок:
+    в FAISS — через IDSelector, в BM25 — через множество допустимых чанков.
+    """
+
+    def __init__(
+        self,
+        db: FAISS,
+        embeddings: Embeddings,
+        catalog: CourseCatalog,
+        k: int = 3,
+        fetch_k: int = 10,
+        rrf_k: int = 60,
+        max_distance: float | None = None,
+        min_lexical_score: float = 0.0,
+    ):
+        self.db = db
+        self.embeddings = embeddings
+        self.catalog = catalog
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.max_distance = max_distance
+        self.min_lexical_score = min_lexical_score
+        # индекс по скалярному произведению хранит нормированные векторы (косинус) — запрос нормируем так же;
+        # у IndexFlatL2 из save_index запрос идёт как есть
+        self.normalize_query = db.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+        # документы в порядке позиций в FAISS-индексе
+        self.docs: list[Document] = [
+            db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)
+        ]
+        for doc in self.docs:
+            if 'ages' not in doc.metadata:
+                doc.metadata.update(annotate_chunk(doc.page_content, catalog))
+        self.bm25 = BM25Index([doc.page_content for doc in self.docs])
+
+    def _allowed(self, age: int | None, courses: set[str]) -> set[int] | None:
+        """Чанки, прошедшие фильтры. None — фильтровать нечего."""
+        if age is None and not courses:
+            return None
+        allowed = set()
+        for i, doc in enumerate(self.docs):
+            ages = doc.metadata.get('ages') or []
+            if age is not None and ages and not any(low <= age <= high for low, high in ages):
+                continue
+            doc_courses = set(doc.metadata.get('courses') or [])
+            if courses and doc_courses and not (doc_courses & courses):
+                continue
+            allowed.add(i)
+        # слишком строгий фильтр не должен оставлять модель без контекста
+        return allowed or None
+
+    def _vector_search(self, vector: list[float], allowed: set[int] | None) -> list[int]:
+        query = np.asarray([vector], dtype=np.float32)
+        if self.normalize_query:
+            faiss.normalize_L2(query)
+        params = None
+        if allowed is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.fromiter(allowed, dtype=np.int64)))
+        distances, indices = self.db.index.search(query, self.fetch_k, params=params)
+        return [
+            int(i) for i, distance in zip(indices[0], distances[0])
+            if i != -1 and (self.max_distance is None or distance <= self.max_distance)
+        ]
+
+    async def ainvoke(self, question: str, history: list | None = None) -> list[Document]:
+        query = self.catalog.parse_dialog(question, history or [])
+        courses = set().union(*(self.catalog.by_keyword[stem] for stem in query.interests))
+        allowed = self._allowed(query.age, courses)
+
+        vector = await self.embeddings.aembed_query(question)
+        vector_ranking = self._vector_search(vector, allowed)
+        lexical_ranking = [
+            doc_id for doc_id, score in self.bm25.search(question, allowed)[: self.fetch_k]
+            if score > self.min_lexical_score
+        ]
+
+        fused: dict[int, float] = defaultdict(float)
+        for ranking in (vector_ranking, lexical_ranking):
+            for rank, doc_id in enumerate(ranking):
+                fused[doc_id] += 1.0 / (self.rrf_k + rank + 1)
+
+        best = sorted(fused, key=fused.get, reverse=True)[: self.k]
+        logger.debug('Hybrid retrieval: allowed=%s vector=%s lexical=%s -> %s',
+                     None if allowed is None else len(allowed), vector_ranking, lexical_ranking, best)
+        return [self.docs[i] for i in best]
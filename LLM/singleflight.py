@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self):
+        self.task: asyncio.Future | None = None
+        self.waiters = 0
+        # для потоковых запросов: уже полученные части и сигнал о новых
+        self.chunks: list = []
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных запросов.
+
+    Первый запрос с ключом (ведущий) запускает работу отдельной задачей,
+    остальные ждут её же и получают тот же результат или ту же ошибку.
+    Отмена одного ожидающего не прерывает работу для остальных; задача
+    отменяется, только когда ждать её больше некому.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._flights: dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key: str, start: Callable[[_Flight], Awaitable]) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(start(flight))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+            logger.debug("%s: joined in-flight request %s (%s waiting)", self.name, key[:32], flight.waiters + 1)
+        flight.waiters += 1
+        return flight
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    @staticmethod
+    def _leave(flight: _Flight) -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._join(key, lambda _: fn())
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(flight)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Потоковый вариант do: каждый ожидающий получает все части с начала."""
+        flight = self._join(key, lambda f: self._pump(f, fn()))
+        try:
+            position = 0
+            while True:
+                if position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                elif flight.task.done():
+                    flight.task.result()  # ошибка ведущего пробрасывается всем
+                    return
+                else:
+                    flight.changed.clear()
+                    await flight.changed.wait()
+        finally:
+            self._leave(flight)
+
+    @staticmethod
+    async def _pump(flight: _Flight, chunks: AsyncIterator) -> None:
+        try:
+            async for chunk in chunks:
+                flight.chunks.append(chunk)
+                flight.changed.set()
+        finally:
+            flight.changed.set()
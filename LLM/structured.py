@@ -0,0 +1,242 @@
+import logging
+import re
+from dataclasses import dataclass, field
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Ключевые слова интересов ребёнка -> курсы. Слова сравниваются по основе
+# (первые STEM_LEN символов), поэтому «роботов», «роботы», «робототехника» совпадают.
+INTEREST_KEYWORDS = {
+    'робот': ['robotics_junior', 'robotics_middle', 'industrial_robotics'],
+    'лего': ['robotics_junior', 'robotics_middle'],
+    'lego': ['robotics_junior', 'robotics_middle'],
+    'конст': ['robotics_junior', 'robotics_middle'],
+    'механ': ['robotics_middle', 'industrial_robotics'],
+    'инжен': ['robotics_middle', 'industrial_robotics'],
+    'техни': ['robotics_middle', 'industrial_robotics'],
+    'автом': ['industrial_robotics'],
+    'scrat': ['scratch'],
+    'скрет': ['scratch'],
+    'скрэт': ['scratch'],
+    'анима': ['scratch'],
+    'мульт': ['scratch'],
+    'minec': ['minecraft'],
+    'майнк': ['minecraft'],
+    'игры': ['scratch', 'minecraft'],
+    'игрул': ['scratch', 'minecraft'],
+    'компь': ['scratch', 'minecraft', 'python'],
+    'прогр': ['scratch', 'minecraft', 'python'],
+    'код': ['minecraft', 'python'],
+    'pytho': ['python'],
+    'питон': ['python'],
+    'пайто': ['python'],
+    'прило': ['python'],
+    'сайт': ['python'],
+    'нейро': ['ai'],
+    'chatg': ['ai'],
+    'ии': ['ai'],
+    'искус': ['ai'],
+    'интел': ['ai'],
+    '3d': ['modeling_3d'],
+    'модел': ['modeling_3d'],
+    'blend': ['modeling_3d'],
+    'рисов': ['modeling_3d'],
+    'рисуе': ['modeling_3d'],
+    'дизай': ['modeling_3d'],
+    'принт': ['modeling_3d'],
+    'кубик': ['puzzles'],
+    'рубик': ['puzzles'],
+    'голов': ['puzzles'],
+    'спидк': ['puzzles'],
+    'конце': ['puzzles'],
+    'усидч': ['puzzles', 'robotics_junior'],
+    'памят': ['puzzles'],
+    'внима': ['puzzles'],
+}
+
+# Вопросы не про выбор курса -> разделы rag.yaml
+TOPIC_KEYWORDS = {
+    'BRANCHES': ['адрес', 'филиа', 'район', 'распол', 'наход', 'добра', 'доеха'],
+    'POLICY': ['стоит', 'стоим', 'цена', 'цену', 'цены', 'оплат', 'распис', 'пробн', 'беспл', 'запис'],
+    'CONTACT': ['телеф', 'номер', 'почт', 'email', 'конта', 'вконт', 'связа'],
+}
+
+STEM_LEN = 5
+
+NUMBER_WORDS = {
+    'три': 3, 'четыре': 4, 'пять': 5, 'шесть': 6, 'семь': 7, 'восемь': 8,
+    'девять': 9, 'десять': 10, 'одиннадцать': 11, 'двенадцать': 12,
+    'тринадцать': 13, 'четырнадцать': 14, 'пятнадцать': 15,
+    'шестнадцать': 16, 'семнадцать': 17,
+}
+
+_NUMBER = r'(\d{1,2}|' + '|'.join(NUMBER_WORDS) + r')'
+AGE_PATTERNS = [
+    # «7 лет», «семь годиков», «10-летний», «12 летней»
+    re.compile(_NUMBER + r'\s*-?\s*(?:лет|год|годик|летн)'),
+    # «ему 7», «дочке 10», «сыну семь»
+    re.compile(r'(?:ему|ей|сыну|дочке|дочери|ребенку|ребёнку|малышу)\s+' + _NUMBER + r'\b'),
+]
+GRADE_PATTERN = re.compile(r'(\d{1,2})\s*-?\s*(?:й|ой|ый)?\s*класс')
+WORD_PATTERN = re.compile(r'[a-zа-яё0-9]+')
+
+MIN_AGE, MAX_AGE = 3, 17
+
+
+def _stem(word: str) -> str:
+    return word[:STEM_LEN]
+
+
+def match_keys(word: str, keys) -> list[str]:
+    """Ключи словаря, совпавшие со словом: по основе, короткие ключи — по префиксу."""
+    stem = _stem(word)
+    return [key for key in keys if key == stem or (len(key) < STEM_LEN and word.startswith(key))]
+
+
+def _to_int(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def parse_age(text: str) -> int | None:
+    """Дешёвый разбор возраста ребёнка из текста сообщения."""
+    text = text.lower()
+    stripped = text.strip(' .!)')
+    # ответ на уточняющий вопрос «сколько лет ребёнку?» — просто число
+    if stripped.isdigit() and MIN_AGE <= int(stripped) <= MAX_AGE:
+        return int(stripped)
+    for pattern in AGE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            age = _to_int(match.group(1))
+            if MIN_AGE <= age <= MAX_AGE:
+                return age
+    match = GRADE_PATTERN.search(text)
+    if match and 1 <= int(match.group(1)) <= 11:
+        return int(match.group(1)) + 6
+    return None
+
+
+@dataclass
+class Query:
+    age: int | None = None
+    interests: set[str] = field(default_factory=set)
+    topics: set[str] = field(default_factory=set)
+
+
+class CourseCatalog:
+    """
+    Структурированный индекс курсов из rag.yaml: по возрасту и по интересам.
+
+    Позволяет ответить на вопрос о выборе курса без эмбеддинга и поиска в FAISS:
+    в контекст попадают ровно подходящие записи курсов.
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.courses = {course['id']: course for course in data.get('COURSES', [])}
+
+        # возраст -> курсы, подходящие по age_min/age_max
+        self.by_age: dict[int, list[str]] = {
+            age: [cid for cid, c in self.courses.items() if c['age_min'] <= age <= c['age_max']]
+            for age in range(MIN_AGE, MAX_AGE + 1)
+        }
+        # возраст -> строка AGE_ROUTING для его возрастной группы
+        self.routing: dict[int, str] = {}
+        for band, directions in data.get('AGE_ROUTING', {}).items():
+            low, high = (int(x) for x in band.split('-'))
+            for age in range(low, high + 1):
+                self.routing.setdefault(age, f'{band} лет: {directions}')
+
+        # основа слова -> курсы (словарь синонимов + теги из yaml)
+        self.by_keyword: dict[str, set[str]] = {k: set(v) for k, v in INTEREST_KEYWORDS.items()}
+        for cid, course in self.courses.items():
+            for tag in course.get('tags', []):
+                for word in WORD_PATTERN.findall(tag.lower()):
+                    if _stem(word) in INTEREST_KEYWORDS:
+                        self.by_keyword[_stem(word)].add(cid)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'CourseCatalog':
+        with open(path, encoding='utf-8') as f:
+            return cls(yaml.safe_load(f))
+
+    def parse(self, text: str) -> Query:
+        query = Query(age=parse_age(text))
+        for word in WORD_PATTERN.findall(text.lower()):
+            query.interests.update(match_keys(word, self.by_keyword))
+            for topic, stems in TOPIC_KEYWORDS.items():
+                if match_keys(word, stems):
+                    query.topics.add(topic)
+        return query
+
+    def courses_in(self, text: str) -> set[str]:
+        """Курсы, упомянутые в тексте (по тем же ключевым словам, что и интересы)."""
+        stems = set()
+        for word in WORD_PATTERN.findall(text.lower()):
+            stems.update(match_keys(word, self.by_keyword))
+        return set().union(*(self.by_keyword[stem] for stem in stems))
+
+    def parse_dialog(self, question: str, history: list) -> Query:
+        """Возраст и интересы из текущего сообщения, при необходимости — из истории."""
+        query = self.parse(question)
+        for message in reversed(history):
+            if message.type != 'human':
+                continue
+            previous = self.parse(message.content)
+            if query.age is None:
+                query.age = previous.age
+            query.interests |= previous.interests
+        return query
+
+    def match(self, query: Query) -> list[dict]:
+        candidates = list(self.courses) if query.age is None else self.by_age.get(query.age, [])
+        if query.interests:
+            wanted = set().union(*(self.by_keyword[stem] for stem in query.interests))
+            by_interest = [cid for cid in candidates if cid in wanted]
+            # интерес не подходит по возрасту — показываем всё, что подходит по возрасту
+            candidates = by_interest or (candidates if query.age is not None else [])
+        elif query.age is None:
+            return []
+        return [self.courses[cid] for cid in candidates]
+
+    @staticmethod
+    def format_course(course: dict) -> str:
+        lines = [
+            f"Курс: {course['title']}",
+            f"Возраст: {course['age_min']}–{course['age_max']} лет; занятие {course['lesson_duration']}; "
+            f"оборудование: {course['equipment']}",
+            f"Кому подходит: {course['when_to_offer']}",
+            f"Описание: {' '.join(str(course['description']).split())}",
+        ]
+        for key, title in (('skills', 'Навыки'), ('child_outcomes', 'Результат'), ('parent_value', 'Польза для родителя')):
+            if course.get(key):
+                lines.append(f"{title}: " + '; '.join(str(item) for item in course[key]))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def format_section(name: str, value) -> str:
+        return f'{name}:\n' + yaml.safe_dump(value, allow_unicode=True, sort_keys=False).strip()
+
+    def build_context(self, question: str, history: list) -> list[str] | None:
+        """
+        Фрагменты контекста из rag.yaml в порядке важности или None, если вопрос
+        не удалось разобрать локально (тогда используется векторный поиск).
+        """
+        query = self.parse_dialog(question, history)
+        courses = self.match(query)
+        if not courses and not query.topics:
+            return None
+
+        parts = []
+        if query.age is not None and query.age in self.routing:
+            parts.append(f'Возраст ребёнка: {query.age} лет. Направления для группы {self.routing[query.age]}')
+        parts.extend(self.format_section(topic, self.data[topic]) for topic in sorted(query.topics) if topic in self.data)
+        parts.extend(self.format_course(course) for course in courses)
+        if 'POLICY' not in query.topics and 'POLICY' in self.data:
+            parts.append(self.format_section('POLICY', self.data['POLICY']))
+
+        logger.debug('Structured route: age=%s interests=%s topics=%s courses=%s',
+                     query.age, sorted(query.interests), sorted(query.topics), [c['id'] for c in courses])
+        return parts
@@ -1,5 +1,7 @@
+import os
 from dataclasses import dataclass
 from environs import Env
+import redis.asyncio as redis
 
 
 @dataclass
@@ -13,10 +15,173 @@ class LogSettings:
     format: str
 
 
+@dataclass
+class RedisSettings:
+    host: str
+    port: int
+    db: int
+    max_connections: int         # Размер общего пула (FSM, хэндлеры, фильтры, LLM)
+    pool_timeout: float          # Сколько ждать свободного соединения из пула, сек
+    socket_timeout: float        # Таймаут операции с Redis, сек
+    connect_timeout: float       # Таймаут установки соединения, сек
+    health_check_interval: int   # PING перед командой, если соединение простаивало дольше, сек
+
+
+@dataclass
+class GigaChatSettings:
+    credentials: str      # Ключ авторизации GigaChat
+    max_concurrency: int  # Максимум одновременных запросов к GigaChat (и размер пула HTTP-соединений)
+    timeout: float        # Таймаут HTTP-запроса к GigaChat, сек
+    warmup: bool          # Прогревать при старте токен GigaChat, страницы индекса и соединения Redis
+
+
+@dataclass
+class StreamingSettings:
+    enabled: bool         # Отправлять ответ LLM по мере генерации (правкой сообщения)
+    edit_interval: float  # Минимальный интервал между правками сообщения, сек
+
+
+@dataclass
+class EmbeddingCacheSettings:
+    ttl: int       # Время жизни эмбеддинга в кэше (Redis и LRU), сек
+    lru_size: int  # Размер in-process LRU, записей
+
+
+@dataclass
+class AnswerCacheSettings:
+    enabled: bool      # Включить семантический кэш ответов
+    threshold: float   # Минимальная косинусная близость вопросов для попадания
+    ttl: int           # Время жизни ответа в кэше, сек
+    max_history: int   # Кэш применяется, только если в истории не больше стольких сообщений
+    max_entries: int   # Максимум ответов в кэше
+
+
+@dataclass
+class StructuredRetrievalSettings:
+    enabled: bool  # Подбирать курсы по rag.yaml без векторного поиска, когда это возможно
+    path: str      # Путь к структурированной базе знаний
+
+
+@dataclass
+class KnowledgeBaseSettings:
+    source_path: str         # Текстовая база знаний (docx), из которой собирается FAISS-индекс
+    index_path: str          # Каталог версий индекса
+    watch_interval: float    # Как часто проверять обновления базы знаний, сек (0 — не проверять)
+    auto_reindex: bool       # Пересобирать индекс, когда изменились rag.docx или rag.yaml
+    embed_batch_size: int    # Чанков в одном запросе эмбеддингов при пересборке
+    embed_concurrency: int   # Одновременных запросов эмбеддингов при пересборке
+
+
+@dataclass
+class RetrievalSettings:
+    k: int                        # Сколько чанков попадает в промпт
+    fetch_k: int                  # Сколько кандидатов берёт каждый из поисков (FAISS и BM25) до слияния
+    rrf_k: int                    # Константа reciprocal rank fusion
+    max_distance: float | None    # Отсечка по L2-расстоянию FAISS (пусто — без отсечки)
+    min_lexical_score: float      # Минимальная оценка BM25
+
+
+@dataclass
+class PromptSettings:
+    max_tokens: int            # Бюджет промпта в токенах (локальная оценка)
+    history_share: float       # Доля бюджета (после системного промпта и вопроса) под историю
+    history_max_messages: int  # Сколько последних сообщений хранится дословно; старые — в сводке
+    summary_max_tokens: int    # Максимальный размер сводки старой части диалога
+
+
+@dataclass
+class DebounceSettings:
+    window: float  # Окно склейки быстрых сообщений пользователя в один вопрос, сек (0 — без ожидания)
+
+
+@dataclass
+class AdmissionSettings:
+    max_active: int    # Сколько ответов LLM готовится одновременно
+    max_queue: int     # Сколько запросов может ждать в очереди; сверх — сразу отказ
+    max_per_user: int  # Сколько запросов одного пользователя может ждать в очереди
+
+
+@dataclass
+class IntentSettings:
+    enabled: bool   # Отвечать на приветствия, контакты, запись и т. п. шаблонами без LLM
+    max_words: int  # Сообщения длиннее этого числа слов всегда уходят в LLM
+
+
+@dataclass
+class FsmCacheSettings:
+    enabled: bool    # Кэшировать состояние FSM в памяти процесса перед Redis
+    max_size: int    # Сколько пользователей держать в кэше
+    ttl: float       # Через сколько секунд запись перечитывается из Redis
+
+
+@dataclass
+class AdminCacheSettings:
+    refresh_interval: float  # Как часто перечитывать список админов из Redis, сек
+    max_staleness: float     # Сколько сек без связи с Redis доверять снимку; дальше — только админы из кода
+    names_ttl: float         # Сколько сек считать свежим закэшированное имя админа
+    names_concurrency: int   # Сколько запросов get_chat за именами делать одновременно
+
+
+@dataclass
+class MediaSettings:
+    check_interval: float  # Как часто сверять версию каталога фото/видео с Redis, сек
+    send_concurrency: int  # Сколько альбомов отправлять в чат одновременно
+    limit: int             # Сколько фото (и отдельно видео) можно хранить
+
+
+@dataclass
+class OutboundSettings:
+    global_rate: float    # Сообщений в секунду на весь бот (Telegram: около 30)
+    private_rate: float   # Сообщений в секунду в один личный чат
+    group_rate: float     # Сообщений в секунду в одну группу (Telegram: 20 в минуту)
+    chat_burst: float     # Сколько сообщений в чат можно отправить подряд без паузы
+    bulk_headroom: float  # Доля общего лимита, которую рассылки оставляют ответам пользователям
+    max_retries: int      # Сколько раз повторять запрос после 429
+
+
+@dataclass
+class BroadcastSettings:
+    batch_size: int         # Сколько пользователей брать из реестра за раз (после каждой пачки — контрольная точка)
+    concurrency: int        # Сколько отправок держать в полёте одновременно
+    report_interval: float  # Как часто обновлять админу сообщение о ходе рассылки, сек
+
+
+@dataclass
+class WebhookSettings:
+    enabled: bool          # Получать обновления через вебхук (иначе — polling в одном процессе)
+    url: str               # Публичный адрес бота (https://bot.example.com), к нему добавляется path
+    path: str              # Путь, на который Telegram присылает обновления
+    secret: str            # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+    host: str              # Адрес, на котором слушает входной процесс
+    port: int              # Порт входного процесса
+    workers: int           # Сколько процессов-обработчиков запускать
+    worker_port: int       # Порт первого обработчика (у следующих +1, +2, ...), слушают только 127.0.0.1
+    drain_timeout: float   # Сколько ждать обработки уже принятых обновлений при остановке, сек
+    dedup_ttl: int         # Сколько помнить update_id, чтобы повтор от Telegram не обработался дважды, сек
+
+
 @dataclass
 class Config:
     bot: TgBot
     log: LogSettings
+    redis: RedisSettings
+    giga: GigaChatSettings
+    stream: StreamingSettings
+    embedding_cache: EmbeddingCacheSettings
+    answer_cache: AnswerCacheSettings
+    structured: StructuredRetrievalSettings
+    kb: KnowledgeBaseSettings
+    retrieval: RetrievalSettings
+    prompt: PromptSettings
+    debounce: DebounceSettings
+    admission: AdmissionSettings
+    intents: IntentSettings
+    fsm_cache: FsmCacheSettings
+    admin_cache: AdminCacheSettings
+    media: MediaSettings
+    outbound: OutboundSettings
+    broadcast: BroadcastSettings
+    webhook: WebhookSettings
 
 
 def load_config(path: str | None = None) -> Config:
@@ -25,4 +190,131 @@ def load_config(path: str | None = None) -> Config:
     return Config(
         bot=TgBot(token=env("BOT_TOKEN")),
         log=LogSettings(level=env("LOG_LEVEL"), format=env("LOG_FORMAT")),
-    )
\ No newline at end of file
+        redis=RedisSettings(
+            host=env("REDIS_HOST", "redis"),
+            port=env.int("REDIS_PORT", 6379),
+            db=env.int("REDIS_DB", 0),
+            max_connections=env.int("REDIS_MAX_CONNECTIONS", 50),
+            pool_timeout=env.float("REDIS_POOL_TIMEOUT", 5.0),
+            socket_timeout=env.float("REDIS_SOCKET_TIMEOUT", 5.0),
+            connect_timeout=env.float("REDIS_CONNECT_TIMEOUT", 3.0),
+            health_check_interval=env.int("REDIS_HEALTH_CHECK_INTERVAL", 30),
+        ),
+        giga=GigaChatSettings(
+            credentials=env("GIGACHAT_KEY"),
+            max_concurrency=env.int("GIGACHAT_MAX_CONCURRENCY", 20),
+            timeout=env.float("GIGACHAT_TIMEOUT", 60.0),
+            warmup=env.bool("LLM_WARMUP", True),
+        ),
+        stream=StreamingSettings(
+            enabled=env.bool("LLM_STREAMING", True),
+            edit_interval=env.float("LLM_STREAM_EDIT_INTERVAL", 1.5),
+        ),
+        embedding_cache=EmbeddingCacheSettings(
+            ttl=env.int("EMBEDDING_CACHE_TTL", 7 * 24 * 3600),
+            lru_size=env.int("EMBEDDING_CACHE_LRU_SIZE", 2048),
+        ),
+        answer_cache=AnswerCacheSettings(
+            enabled=env.bool("ANSWER_CACHE_ENABLED", True),
+            threshold=env.float("ANSWER_CACHE_THRESHOLD", 0.92),
+            ttl=env.int("ANSWER_CACHE_TTL", 24 * 3600),
+            max_history=env.int("ANSWER_CACHE_MAX_HISTORY", 0),
+            max_entries=env.int("ANSWER_CACHE_MAX_ENTRIES", 1000),
+        ),
+        structured=StructuredRetrievalSettings(
+            enabled=env.bool("STRUCTURED_RETRIEVAL", True),
+            path=env("STRUCTURED_RETRIEVAL_PATH", "LLM/rag.yaml"),
+        ),
+        kb=KnowledgeBaseSettings(
+            source_path=env("KB_SOURCE_PATH", "LLM/rag.docx"),
+            index_path=env("KB_INDEX_PATH", "LLM/faiss_db"),
+            watch_interval=env.float("KB_WATCH_INTERVAL", 30.0),
+            auto_reindex=env.bool("KB_AUTO_REINDEX", True),
+            embed_batch_size=env.int("KB_EMBED_BATCH_SIZE", 16),
+            embed_concurrency=env.int("KB_EMBED_CONCURRENCY", 4),
+        ),
+        retrieval=RetrievalSettings(
+            k=env.int("RETRIEVAL_K", 3),
+            fetch_k=env.int("RETRIEVAL_FETCH_K", 10),
+            rrf_k=env.int("RETRIEVAL_RRF_K", 60),
+            max_distance=env.float("RETRIEVAL_MAX_DISTANCE", None),
+            min_lexical_score=env.float("RETRIEVAL_MIN_LEXICAL_SCORE", 0.0),
+        ),
+        prompt=PromptSettings(
+            max_tokens=env.int("PROMPT_MAX_TOKENS", 2000),
+            history_share=env.float("PROMPT_HISTORY_SHARE", 0.3),
+            history_max_messages=env.int("HISTORY_MAX_MESSAGES", 6),
+            summary_max_tokens=env.int("HISTORY_SUMMARY_MAX_TOKENS", 200),
+        ),
+        debounce=DebounceSettings(window=env.float("MESSAGE_COALESCE_WINDOW", 1.5)),
+        admission=AdmissionSettings(
+            max_active=env.int("LLM_MAX_ACTIVE", env.int("GIGACHAT_MAX_CONCURRENCY", 20)),
+            max_queue=env.int("LLM_QUEUE_SIZE", 100),
+            max_per_user=env.int("LLM_QUEUE_PER_USER", 1),
+        ),
+        intents=IntentSettings(
+            enabled=env.bool("INTENT_ROUTER", True),
+            max_words=env.int("INTENT_ROUTER_MAX_WORDS", 8),
+        ),
+        fsm_cache=FsmCacheSettings(
+            enabled=env.bool("FSM_CACHE", True),
+            max_size=env.int("FSM_CACHE_SIZE", 10000),
+            ttl=env.float("FSM_CACHE_TTL", 30.0),
+        ),
+        admin_cache=AdminCacheSettings(
+            refresh_interval=env.float("ADMIN_CACHE_REFRESH_INTERVAL", 60.0),
+            max_staleness=env.float("ADMIN_CACHE_MAX_STALENESS", 300.0),
+            names_ttl=env.float("ADMIN_NAMES_TTL", 24 * 3600),
+            names_concurrency=env.int("ADMIN_NAMES_CONCURRENCY", 5),
+        ),
+        media=MediaSettings(
+            check_interval=env.float("MEDIA_CACHE_CHECK_INTERVAL", 5.0),
+            send_concurrency=env.int("MEDIA_SEND_CONCURRENCY", 3),
+            limit=env.int("MEDIA_LIMIT", 10),
+        ),
+        outbound=OutboundSettings(
+            global_rate=env.float("TG_GLOBAL_RATE", 30.0),
+            private_rate=env.float("TG_PRIVATE_CHAT_RATE", 1.0),
+            group_rate=env.float("TG_GROUP_CHAT_RATE", 20 / 60),
+            chat_burst=env.float("TG_CHAT_BURST", 3.0),
+            bulk_headroom=env.float("TG_BULK_HEADROOM", 0.2),
+            max_retries=env.int("TG_MAX_RETRIES", 3),
+        ),
+        broadcast=BroadcastSettings(
+            batch_size=env.int("BROADCAST_BATCH_SIZE", 200),
+            concurrency=env.int("BROADCAST_CONCURRENCY", 30),
+            report_interval=env.float("BROADCAST_REPORT_INTERVAL", 10.0),
+        ),
+        webhook=WebhookSettings(
+            enabled=env.bool("WEBHOOK", False),
+            url=env("WEBHOOK_URL", ""),
+            path=env("WEBHOOK_PATH", "/webhook"),
+            secret=env("WEBHOOK_SECRET", ""),
+            host=env("WEBHOOK_HOST", "0.0.0.0"),
+            port=env.int("WEBHOOK_PORT", 8080),
+            workers=env.int("WEBHOOK_WORKERS", os.cpu_count() or 1),
+            worker_port=env.int("WEBHOOK_WORKER_PORT", 8081),
+            drain_timeout=env.float("WEBHOOK_DRAIN_TIMEOUT", 30.0),
+            dedup_ttl=env.int("WEBHOOK_DEDUP_TTL", 3600),
+        ),
+    )
+
+
+def create_redis(settings: RedisSettings) -> redis.Redis:
+    """
+    Единый асинхронный клиент Redis процесса. Пул блокирующий: при нехватке
+    соединений команда ждёт свободное до pool_timeout, а не падает сразу.
+    Пул принадлежит клиенту и закрывается вместе с ним (aclose).
+    """
+    pool = redis.BlockingConnectionPool(
+        host=settings.host,
+        port=settings.port,
+        db=settings.db,
+        max_connections=settings.max_connections,
+        timeout=settings.pool_timeout,
+        socket_timeout=settings.socket_timeout,
+        socket_connect_timeout=settings.connect_timeout,
+        health_check_interval=settings.health_check_interval,
+        decode_responses=True,
+    )
+    return redis.Redis.from_pool(pool)
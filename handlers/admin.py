@@ -1,17 +1,44 @@
+import asyncio
+import html
+import logging
+import os
+import shutil
+import time
+
 from aiogram import F, Router
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import StatesGroup, State, default_state
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto, InputMediaVideo, ReplyKeyboardRemove
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 import secrets
 from keyboards.keyboards import create_keyboards
 from lexicon.lexicon import ADMIN_BUTTON_LEXICON
 from utils import IsAdmin
 from keyboards.inlinekeyboards import create_inline_keyboards, create_inline_keyboards_callback
+from config.config import Config
+from LLM.indexer import IndexDiff, Progress, validate_source
+from LLM.llm import reindex
+from services.admins import AdminRegistry
+from services.admission import AdmissionController
+from services.broadcast import Broadcaster
+from services.media import PHOTO, VIDEO, MediaCatalog
+from services.outbound import OutboundLimiter
+from services.users import UserRegistry
+
+logger = logging.getLogger(__name__)
 
 # Создаем роутер для админ-команд
 admin_router = Router()
 
+# Фоновые задачи пересборки (ссылки держим, чтобы задачи не собрал сборщик мусора)
+background_tasks: set[asyncio.Task] = set()
+
+# Максимальный размер файла, который бот может скачать через Bot API
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# Не чаще одной правки сообщения о ходе пересборки за столько секунд
+PROGRESS_EDIT_INTERVAL = 3.0
+
 # Список ID админов
 
 admin_list = [5393901453]
@@ -30,8 +57,65 @@ class FSMAdmin(StatesGroup):
     delete_admin = State()      # Состояние удаления админа
     delete_photo = State()      # Состояние удаления фото
     delete_video = State()      # Состояние удаления видео
+    upload_kb = State()         # Состояние загрузки файла базы знаний
+    broadcast = State()         # Состояние ввода сообщения для рассылки
+    broadcast_confirm = State() # Состояние подтверждения рассылки
 # -------------------- ХЭНДЛЕРЫ --------------------
 
+# /llm_stats — состояние очереди к LLM
+@admin_router.message(Command(commands='llm_stats'))
+async def llm_stats(message: Message, admission: AdmissionController):
+    metrics = admission.metrics
+    await message.answer(
+        f'Очередь к LLM\n'
+        f'Выполняется: {metrics.active} из {admission.max_active}\n'
+        f'Ожидают: {metrics.queued} (максимум {admission.max_queue})\n'
+        f'Принято: {metrics.admitted}, отклонено: {metrics.rejected}\n'
+        f'Ожидание: среднее {metrics.avg_wait:.1f} с, максимальное {metrics.max_wait:.1f} с, '
+        f'последнее {metrics.last_wait:.1f} с'
+    )
+
+
+# /send_stats — очередь исходящих сообщений в Telegram
+@admin_router.message(Command(commands='send_stats'))
+async def send_stats(message: Message, outbound: OutboundLimiter):
+    metrics = outbound.metrics
+    await message.answer(
+        f'Исходящие сообщения\n'
+        f'Отправлено: {metrics.sent}, не отправлено: {metrics.failed}\n'
+        f'Ожидают: ответы {metrics.waiting_interactive}, рассылки {metrics.waiting_bulk}\n'
+        f'Задержано лимитами: {metrics.throttled}, ожидание среднее {metrics.avg_delay:.1f} с, '
+        f'максимальное {metrics.max_delay:.1f} с\n'
+        f'Ответов 429: {metrics.retry_after}, последний retry_after {metrics.last_retry_after:.0f} с'
+    )
+
+
+def format_index_diff(diff: IndexDiff) -> str:
+    if not diff.changed:
+        return f'База знаний не изменилась (версия {diff.version}).'
+    lines = [
+        f'База знаний обновлена: {diff.previous_version or "—"} → {diff.version} за {diff.seconds:.1f} с',
+        f'Новых и изменённых фрагментов: {diff.added}, удалённых: {diff.removed}, без изменений: {diff.kept}',
+    ]
+    if diff.catalog_changed:
+        lines.append('Каталог курсов (rag.yaml) изменён.')
+    lines += ['+ ' + text for text in diff.added_preview]
+    lines += ['− ' + text for text in diff.removed_preview]
+    return '\n'.join(lines)
+
+
+# /reindex — пересобрать индекс базы знаний и подменить его без перезапуска
+@admin_router.message(Command(commands='reindex'))
+async def reindex_knowledge_base(message: Message):
+    await message.answer('Пересобираю индекс базы знаний…')
+    try:
+        diff = await reindex()
+    except Exception as e:
+        await message.answer(f'Не удалось пересобрать индекс: {html.escape(str(e))}')
+        raise
+    await message.answer(format_index_diff(diff), parse_mode=None)
+
+
 # /admin — показать панель администратора
 @admin_router.message(Command(commands='admin'), StateFilter(default_state))
 async def admin_buttons(message: Message, state: FSMContext):
@@ -64,11 +148,10 @@ async def add_new_admin(message: Message, state: FSMContext):
 
 # добавления админа
 @admin_router.message(F.text !='отмена',StateFilter(FSMAdmin.add_new_admin))
-async def save_new_admin(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
+async def save_new_admin(message: Message, state: FSMContext, admins: AdminRegistry):
     if message.forward_from:
         user_id = message.forward_from.id
-        await redis_client.sadd('admins', user_id)
+        await admins.add(user_id, message.forward_from.first_name)
         await message.answer(
             'Новый Администратор успешно добавлен!',
             reply_markup=create_keyboards(['ок'], 2).as_markup(resize_keyboard=True)
@@ -83,18 +166,11 @@ async def save_new_admin(message: Message, state: FSMContext):
 
 # запрос на удаления админа бота
 @admin_router.message(F.text=='Удалить админа бота',StateFilter(FSMAdmin.admin_panel))
-async def response_delete_admin(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    admin_ids = await redis_client.smembers('admins')
-    admins_names =[]
-
-    if admin_ids:
-        for admin_id in admin_ids:
-            admin = await  message.bot.get_chat(admin_id)
-            admins_names.append(admin.first_name)
-
-        admin_id_and_name = dict(zip(admin_ids, admins_names))
+async def response_delete_admin(message: Message, state: FSMContext, admins: AdminRegistry):
+    # имена берутся из кэша в Redis; в Telegram идём только за недостающими
+    admin_id_and_name = await admins.names(message.bot)
 
+    if admin_id_and_name:
         await message.answer(
             'Выберите админа которого хотите удалить:',
             reply_markup=create_inline_keyboards_callback(admin_id_and_name)
@@ -109,10 +185,7 @@ async def response_delete_admin(message: Message, state: FSMContext):
 
 # Обработчик callback запроса для удаления администратора
 @admin_router.callback_query(F.data, StateFilter(FSMAdmin.delete_admin))
-async def delete_admin(callback: CallbackQuery, state: FSMContext):
-    # Получаем объект Redis из бота
-    redis_client = getattr(callback.bot, 'redis_client')
-
+async def delete_admin(callback: CallbackQuery, state: FSMContext, admins: AdminRegistry):
     # Получаем ID администратора из callback data
     admin_id = callback.data
 
@@ -126,24 +199,21 @@ async def delete_admin(callback: CallbackQuery, state: FSMContext):
     # Преобразуем admin_id в число
     admin_id = int(admin_id)
 
-    # Получаем объект чата администратора
-    name = await callback.bot.get_chat(admin_id)
+    # Имя администратора (из кэша, до удаления)
+    name = await admins.name(callback.bot, admin_id)
 
-    # Проверяем, есть ли этот админ в Redis
-    is_admin = await redis_client.sismember('admins', admin_id)
+    # Удаляем администратора из Redis; False — его не было в списке
+    removed = await admins.remove(admin_id)
 
-    if not is_admin:
+    if not removed:
         # Если админа нет в списке, отправляем сообщение
         await callback.message.answer("Выберите администратора которого хотите удалить из списка выше")
         await callback.answer()
         return
 
-    # Удаляем администратора из Redis
-    await redis_client.srem('admins', admin_id)
-
     # Отправляем сообщение пользователю о том, что админ удален
     await callback.message.answer(
-        f'{name.first_name} Больше не является Администратором',
+        f'{name} Больше не является Администратором',
         reply_markup=create_keyboards(["ок"], 1).as_markup(resize_keyboard=True)
     )
 
@@ -156,27 +226,23 @@ async def delete_admin(callback: CallbackQuery, state: FSMContext):
 
 # Просмотр всех фотографий из базы Redis
 @admin_router.message(F.text == ADMIN_BUTTON_LEXICON['get_photos'], StateFilter(FSMAdmin.admin_panel))
-async def get_photos(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    photo_list = await redis_client.lrange("photos", 0, -1)
-    if not photo_list:
+async def get_photos(message: Message, state: FSMContext, media: MediaCatalog):
+    photos = await media.items(PHOTO)
+    if not photos:
         await message.answer("фотографий пока нет.")
         return
     else:
-        media = [InputMediaPhoto(media=pid) for pid in photo_list]
-        await message.answer_media_group(media)
+        await media.send_items(message, photos)
 
 # Просмотр всех видео из Redis
 @admin_router.message(F.text == ADMIN_BUTTON_LEXICON['get_videos'], StateFilter(FSMAdmin.admin_panel))
-async def get_videos(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    video_list = await redis_client.lrange("videos", 0, -1)
-    if not video_list:
+async def get_videos(message: Message, state: FSMContext, media: MediaCatalog):
+    videos = await media.items(VIDEO)
+    if not videos:
         await message.answer("Видео пока нет.")
         return
     else:
-        media = [InputMediaVideo(media=vid) for vid in video_list]
-        await message.answer_media_group(media)
+        await media.send_items(message, videos)
 
 
 # Начало добавления видео
@@ -190,16 +256,15 @@ async def add_video(message: Message, state: FSMContext):
 
 # Сохранение видео
 @admin_router.message(F.content_type == 'video', StateFilter(FSMAdmin.add_video))
-async def save_video(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    video_list = await redis_client.lrange("videos", 0, -1)
-    if len(video_list)>=10:
-        await message.answer("Количество видео в хранилище достигло 10 шт,"
+async def save_video(message: Message, state: FSMContext, media: MediaCatalog):
+    # лимит, повтор и запись проверяются в Redis одной атомарной операцией
+    result = await media.add(VIDEO, message.video.file_id, message.video.file_unique_id, message.from_user.id)
+    if result.status == 'full':
+        await message.answer(f"Количество видео в хранилище достигло {media.limit} шт,"
                              "Сначала удалите один из старых видео ")
-
+    elif result.status == 'duplicate':
+        await message.answer('Это видео уже есть в хранилище')
     else:
-        video_id = message.video.file_id
-        await redis_client.rpush('videos', video_id)
         await message.answer(
         'Видео успешно сохранено!',
         reply_markup=create_keyboards(["ок"],1).as_markup(resize_keyboard=True)
@@ -209,14 +274,14 @@ async def save_video(message: Message, state: FSMContext):
 
 # запрос на удаление видео
 @admin_router.message(F.text == ADMIN_BUTTON_LEXICON['delete_video'], StateFilter(FSMAdmin.admin_panel))
-async def request_for_remove_video(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    video_list = await redis_client.lrange("videos", 0, -1)
-    if not video_list:
+async def request_for_remove_video(message: Message, state: FSMContext, media: MediaCatalog):
+    videos = await media.items(VIDEO)
+    if not videos:
         await message.answer('видеоматериалов нет, удалять нечего')
     else:
-        media = [InputMediaVideo(media=pid) for pid in video_list]
-        await message.answer_media_group(media)
+        await media.send_items(message, videos)
+        # порядковый номер из ответа админа сопоставляется с id показанных видео
+        await state.update_data(media_ids=[item.id for item in videos])
         await message.answer(
             'Введите порядковый номер видео которое хотите удалить',
             reply_markup=create_keyboards(["отмена"],1).as_markup(resize_keyboard=True)
@@ -226,19 +291,21 @@ async def request_for_remove_video(message: Message, state: FSMContext):
 
 # удаление видео
 @admin_router.message(F.text & (F.text != 'отмена'), StateFilter(FSMAdmin.delete_video))
-async def delete_video(message: Message, state: FSMContext):
-    if message.text.isdigit() and (0 < int(message.text) <= 10):
-        redis_client = getattr(message.bot, 'redis_client')
-        delete_video_id = await redis_client.lindex('videos', int(message.text)-1)
+async def delete_video(message: Message, state: FSMContext, media: MediaCatalog):
+    media_ids = (await state.get_data()).get('media_ids', [])
+    if message.text.isdigit() and (0 < int(message.text) <= len(media_ids)):
+        delete_video_id = await media.remove(VIDEO, media_ids[int(message.text)-1])
         if delete_video_id:
             await message.answer('Вы удалили данное видео:')
             await message.answer_video(delete_video_id)
-            await redis_client.lrem('videos', 1, delete_video_id)
-            await state.set_state(FSMAdmin.admin_panel)
-            button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
-            await message.answer('Панель Администратора',
-                reply_markup = create_keyboards(button_list,2).as_markup(resize_keyboard=True)
-            )
+        else:
+            await message.answer('Это видео уже удалено')
+        await state.set_data({})
+        await state.set_state(FSMAdmin.admin_panel)
+        button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
+        await message.answer('Панель Администратора',
+            reply_markup = create_keyboards(button_list,2).as_markup(resize_keyboard=True)
+        )
     else:
         await message.answer(
             "Видео под таким индексом нет",
@@ -249,14 +316,14 @@ async def delete_video(message: Message, state: FSMContext):
 
 # запрос на удаление фото
 @admin_router.message(F.text == ADMIN_BUTTON_LEXICON['delete_photo'], StateFilter(FSMAdmin.admin_panel))
-async def request_for_remove_photo(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot, 'redis_client')
-    photo_list = await redis_client.lrange("photos", 0, -1)
-    if not photo_list:
+async def request_for_remove_photo(message: Message, state: FSMContext, media: MediaCatalog):
+    photos = await media.items(PHOTO)
+    if not photos:
         await message.answer('фотографий нет, удалять нечего')
     else:
-        media = [InputMediaPhoto(media=pid) for pid in photo_list]
-        await message.answer_media_group(media)
+        await media.send_items(message, photos)
+        # порядковый номер из ответа админа сопоставляется с id показанных фото
+        await state.update_data(media_ids=[item.id for item in photos])
         await message.answer(
             'Введите порядковый номер фото которого хотите удалить',
             reply_markup=create_keyboards(["отмена"],1).as_markup(resize_keyboard=True)
@@ -264,23 +331,25 @@ async def request_for_remove_photo(message: Message, state: FSMContext):
         await state.set_state(FSMAdmin.delete_photo)
 
 # удаление фото
-@admin_router.message(F.text != 'отмена', StateFilter(FSMAdmin.delete_photo))
-async def delete_video(message: Message, state: FSMContext):
-    if message.text.isdigit() and (0 < int(message.text) <= 10):
-        redis_client = getattr(message.bot, 'redis_client')
-        delete_photo_id = await redis_client.lindex('photos', int(message.text)-1)
+@admin_router.message(F.text & (F.text != 'отмена'), StateFilter(FSMAdmin.delete_photo))
+async def delete_photo(message: Message, state: FSMContext, media: MediaCatalog):
+    media_ids = (await state.get_data()).get('media_ids', [])
+    if message.text.isdigit() and (0 < int(message.text) <= len(media_ids)):
+        delete_photo_id = await media.remove(PHOTO, media_ids[int(message.text)-1])
         if delete_photo_id:
             await message.answer('Вы удалили данное фото:')
             await message.answer_photo(delete_photo_id)
-            await redis_client.lrem('photos', 1, delete_photo_id)
+        else:
+            await message.answer('Это фото уже удалено')
 
-            button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
-            await message.answer(
-                'Панель Администратора',
-                reply_markup=create_keyboards(button_list, 2).as_markup(resize_keyboard=True)
+        button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
+        await message.answer(
+            'Панель Администратора',
+            reply_markup=create_keyboards(button_list, 2).as_markup(resize_keyboard=True)
 
-            )
-            await state.set_state(FSMAdmin.admin_panel)
+        )
+        await state.set_data({})
+        await state.set_state(FSMAdmin.admin_panel)
 
     else:
         await message.answer(
@@ -299,15 +368,16 @@ async def add_photo(message: Message, state: FSMContext):
 
 # Сохранение фото в Redis
 @admin_router.message(F.content_type == 'photo', StateFilter(FSMAdmin.add_photo))
-async def save_photo(message: Message, state: FSMContext):
-    redis_client = getattr(message.bot,'redis_client')
-    photo_list = await redis_client.lrange("photos", 0, -1)
-    if len(photo_list)>=10:
-        await message.answer("Количество фотографий в хранилище достигло 10 шт,"
-                             "Сначала удалите один из старых видео ")
+async def save_photo(message: Message, state: FSMContext, media: MediaCatalog):
+    # лимит, повтор и запись проверяются в Redis одной атомарной операцией
+    photo = message.photo[-1]
+    result = await media.add(PHOTO, photo.file_id, photo.file_unique_id, message.from_user.id)
+    if result.status == 'full':
+        await message.answer(f"Количество фотографий в хранилище достигло {media.limit} шт,"
+                             "Сначала удалите одну из старых фотографий ")
+    elif result.status == 'duplicate':
+        await message.answer('Эта фотография уже есть в хранилище')
     else:
-        photo_id = message.photo[-1].file_id
-        await redis_client.rpush('photos', photo_id)
         await message.answer(
         'Фотография успешно сохранена!',
         reply_markup=create_keyboards(["ок"], 1).as_markup(resize_keyboard=True)
@@ -315,6 +385,150 @@ async def save_photo(message: Message, state: FSMContext):
     await state.set_state(FSMAdmin.admin_panel)
 
 
+# Начало обновления базы знаний
+@admin_router.message(F.text == ADMIN_BUTTON_LEXICON['update_kb'], StateFilter(FSMAdmin.admin_panel))
+async def request_kb_document(message: Message, state: FSMContext):
+    await message.answer(
+        'Пришлите файл базы знаний:\n'
+        '• rag.docx — текст о школе и курсах\n'
+        '• rag.yaml — структурированный каталог курсов',
+        reply_markup=create_keyboards(["отмена"], 1).as_markup(resize_keyboard=True)
+    )
+    await state.set_state(FSMAdmin.upload_kb)
+
+
+def progress_editor(progress_message: Message) -> Progress:
+    """Ход пересборки — правками одного сообщения, не чаще PROGRESS_EDIT_INTERVAL."""
+    last_edit = 0.0
+
+    async def report(text: str):
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await progress_message.edit_text(f'Обновление базы знаний: {text}')
+        except TelegramAPIError:
+            pass
+
+    return report
+
+
+async def apply_kb_document(progress_message: Message, uploaded_path: str, target_path: str):
+    """Подменяет исходный файл базы знаний и пересобирает индекс; при ошибке возвращает старый файл."""
+    backup_path = target_path + '.bak'
+    await asyncio.to_thread(shutil.copyfile, target_path, backup_path)
+    await asyncio.to_thread(shutil.copyfile, uploaded_path, target_path)
+    os.remove(uploaded_path)
+    try:
+        diff = await reindex(progress_editor(progress_message))
+    except Exception as e:
+        logger.exception('Knowledge base update failed, restoring %s', target_path)
+        await asyncio.to_thread(shutil.copyfile, backup_path, target_path)
+        os.remove(backup_path)
+        await progress_message.edit_text(
+            f'Не удалось обновить базу знаний, оставлена прежняя версия: {html.escape(str(e))}'
+        )
+        return
+    # новый индекс собран — резервная копия больше не нужна
+    os.remove(backup_path)
+    await progress_message.edit_text(format_index_diff(diff), parse_mode=None)
+
+
+# Приём файла базы знаний: скачиваем, проверяем и пересобираем индекс в фоне
+@admin_router.message(F.document, StateFilter(FSMAdmin.upload_kb))
+async def upload_kb_document(message: Message, state: FSMContext, config: Config):
+    if background_tasks:
+        await message.answer('Предыдущее обновление базы знаний ещё не закончилось, подождите немного')
+        return
+    file_name = (message.document.file_name or '').lower()
+    if file_name.endswith('.docx'):
+        target_path = config.kb.source_path
+    elif file_name.endswith(('.yaml', '.yml')):
+        target_path = config.structured.path
+    else:
+        await message.answer('Нужен файл .docx или .yaml')
+        return
+    if message.document.file_size and message.document.file_size > MAX_UPLOAD_SIZE:
+        await message.answer('Файл слишком большой: бот может скачать не больше 20 МБ')
+        return
+
+    # файл пишется на диск по частям, не целиком в память
+    uploaded_path = target_path + '.upload' + os.path.splitext(target_path)[1]
+    await message.bot.download(message.document, destination=uploaded_path)
+    try:
+        summary = await asyncio.to_thread(validate_source, uploaded_path)
+    except Exception as e:
+        os.remove(uploaded_path)
+        await message.answer(
+            f'Файл не подходит: {e}',
+            parse_mode=None,
+            reply_markup=create_keyboards(["отмена"], 1).as_markup(resize_keyboard=True)
+        )
+        return
+
+    button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
+    await message.answer(
+        f'Файл принят ({summary}). Индекс пересобирается в фоне, бот продолжает отвечать.',
+        reply_markup=create_keyboards(button_list, 2).as_markup(resize_keyboard=True)
+    )
+    await state.set_state(FSMAdmin.admin_panel)
+
+    progress_message = await message.answer('Обновление базы знаний: начинаю…')
+    task = asyncio.create_task(apply_kb_document(progress_message, uploaded_path, target_path))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+# Начало рассылки
+@admin_router.message(F.text == ADMIN_BUTTON_LEXICON['broadcast'], StateFilter(FSMAdmin.admin_panel))
+async def request_broadcast_message(message: Message, state: FSMContext, broadcaster: Broadcaster):
+    if await broadcaster.status() == 'running':
+        await message.answer('Предыдущая рассылка ещё идёт. Остановить её: /broadcast_cancel')
+        return
+    await message.answer(
+        'Пришлите сообщение для рассылки: текст, фото, видео или документ с подписью',
+        reply_markup=create_keyboards(["отмена"], 1).as_markup(resize_keyboard=True)
+    )
+    await state.set_state(FSMAdmin.broadcast)
+
+# Сообщение для рассылки: показываем, как его увидят пользователи, и просим подтвердить
+@admin_router.message(F.text != 'отмена', StateFilter(FSMAdmin.broadcast))
+async def preview_broadcast(message: Message, state: FSMContext, users: UserRegistry):
+    if message.media_group_id:
+        await message.answer('Альбом разослать нельзя — пришлите одно фото или видео с подписью')
+        return
+    await message.send_copy(chat_id=message.chat.id)
+    await state.update_data(broadcast_message_id=message.message_id)
+    await message.answer(
+        f'Так сообщение увидят пользователи. Получателей: {await users.count()}. Отправить?',
+        reply_markup=create_keyboards(["Отправить", "отмена"], 2).as_markup(resize_keyboard=True)
+    )
+    await state.set_state(FSMAdmin.broadcast_confirm)
+
+# Подтверждение рассылки: запускаем фоновую задачу, о ходе рассылки бот сообщит отдельно
+@admin_router.message(F.text == 'Отправить', StateFilter(FSMAdmin.broadcast_confirm))
+async def start_broadcast(message: Message, state: FSMContext, broadcaster: Broadcaster):
+    message_id = (await state.get_data()).get('broadcast_message_id')
+    started = message_id is not None and await broadcaster.start(
+        message.bot, admin_chat_id=message.chat.id, from_chat_id=message.chat.id, message_id=message_id
+    )
+    button_list = [value for key, value in ADMIN_BUTTON_LEXICON.items()]
+    await message.answer(
+        'Рассылка запущена. Остановить: /broadcast_cancel' if started else 'Рассылка уже идёт',
+        reply_markup=create_keyboards(button_list, 2).as_markup(resize_keyboard=True)
+    )
+    await state.set_data({})
+    await state.set_state(FSMAdmin.admin_panel)
+
+# /broadcast_cancel — остановить рассылку (уже отправленные сообщения остаются)
+@admin_router.message(Command(commands='broadcast_cancel'))
+async def cancel_broadcast(message: Message, broadcaster: Broadcaster):
+    if await broadcaster.cancel():
+        await message.answer('Рассылка останавливается…')
+    else:
+        await message.answer('Сейчас нет активной рассылки')
+
 
 # Отмена текущего действия
 @admin_router.message(F.text.in_(['отмена','ок']), ~StateFilter([default_state, FSMAdmin.admin_panel]))
@@ -334,6 +548,14 @@ async def error_save_video(message: Message, state: FSMContext):
         reply_markup=create_keyboards(["отмена"], 1).as_markup(resize_keyboard=True)
     )
 
+# Ошибка при отправке не файла вместо базы знаний
+@admin_router.message(StateFilter(FSMAdmin.upload_kb))
+async def error_upload_kb(message: Message, state: FSMContext):
+    await message.answer(
+        'Пришлите файл .docx или .yaml документом',
+        reply_markup=create_keyboards(["отмена"], 1).as_markup(resize_keyboard=True)
+    )
+
 # Ошибка при отправке не фото вместо фото
 @admin_router.message(StateFilter(FSMAdmin.add_photo))
 async def error_save_photo(message: Message, state: FSMContext):
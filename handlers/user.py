@@ -1,11 +1,23 @@
+import asyncio
+from contextlib import suppress
+
+from aiogram.exceptions import TelegramAPIError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import default_state
-from aiogram.types import Message, CallbackQuery, InputMediaVideo, InputMediaPhoto
+from aiogram.types import Message, CallbackQuery
 from aiogram import F, Router
 from aiogram.filters import Command, CommandStart, StateFilter
+from aiogram.utils.chat_action import ChatActionSender
+from config.config import Config
 from lexicon.lexicon import COMMAND_LEXICON, OTHER_LEXICON
-from LLM.llm import ask_giga_chat_async
+from LLM.history import AsyncRedisChatMessageHistory
+from LLM.intents import detect_intent
+from LLM.llm import ask_giga_chat_async, load_history, stream_giga_chat_async
 from keyboards.inlinekeyboards import create_inline_keyboards
+from services.admission import PRIORITY_FOLLOW_UP, PRIORITY_NEW, AdmissionController, AdmissionRejected
+from services.debounce import MessageCoalescer
+from services.media import MediaCatalog
+from services.streaming import stream_to_message
 
 
 user_router = Router()
@@ -43,51 +55,94 @@ async def consultation_response(callback_query: CallbackQuery):
     await callback_query.answer()  # убираем "часики"
 
 
+# Шаблонные ответы на простые сообщения: интент -> (текст, кнопки)
+INTENT_REPLIES = {
+    'greeting': (COMMAND_LEXICON['/start'], ('sign_up', 'consultation', 'view_media')),
+    'thanks': (OTHER_LEXICON['thanks'], ('sign_up', 'view_media')),
+    'contacts': (OTHER_LEXICON['contacts'], ('sign_up',)),
+    'sign_up': (OTHER_LEXICON['sign up for a course'], ('view_media',)),
+    'consultation': (OTHER_LEXICON['consultation'], ()),
+}
+
+
+async def answer_with_template(message: Message, intent: str):
+    text, buttons = INTENT_REPLIES[intent]
+    await message.answer(text=text, reply_markup=create_inline_keyboards(*buttons) if buttons else None)
+
+
+async def answer_with_llm(message: Message, question: str, config: Config, admission: AdmissionController):
+    # история читается один раз: по ней выбирается приоритет, и она же идёт в промпт
+    history = await load_history(str(message.from_user.id))
+    # новые разговоры обслуживаются раньше продолжений
+    priority = PRIORITY_FOLLOW_UP if await history.aexists() else PRIORITY_NEW
+    try:
+        # пока запрос ждёт своей очереди, пользователь видит «печатает…»
+        async with admission.admit(
+            message.from_user.id,
+            priority,
+            waiting=ChatActionSender.typing(bot=message.bot, chat_id=message.chat.id),
+        ):
+            await generate_answer(message, question, config, history)
+    except AdmissionRejected:
+        await message.answer(OTHER_LEXICON['llm_busy'])
+
+
+async def generate_answer(message: Message, question: str, config: Config,
+                          history: AsyncRedisChatMessageHistory | None = None):
+    session_id = str(message.from_user.id)
+    reply_markup = create_inline_keyboards('sign_up','view_media')
+
+    if not config.stream.enabled:
+        # Генерируем ответ через GigaChat целиком
+        response = await ask_giga_chat_async(question, session_id, history)
+        await message.answer(text=response, reply_markup=reply_markup)
+        return
+
+    # Сразу отправляем заглушку и дописываем в неё ответ по мере генерации
+    placeholder = await message.answer(OTHER_LEXICON['llm_placeholder'])
+    try:
+        await stream_to_message(
+            placeholder,
+            stream_giga_chat_async(question, session_id, history),
+            edit_interval=config.stream.edit_interval,
+            reply_markup=reply_markup,
+            empty_text=OTHER_LEXICON['llm_empty'],
+        )
+    except asyncio.CancelledError:
+        # пользователь дописал вопрос — недописанный ответ убираем
+        with suppress(TelegramAPIError):
+            await placeholder.delete()
+        raise
+
+
 # Ответы через LLM на любые текстовые сообщения
 @user_router.message(F.text)
-async def llm_response(message: Message):
-    # Генерируем ответ через GigaChat
-    response = await ask_giga_chat_async(message.text, str(message.from_user.id))
-    await message.answer(
-        text=response,
-        reply_markup=create_inline_keyboards('sign_up','view_media')
-    )
+async def llm_response(message: Message, config: Config, coalescer: MessageCoalescer,
+                       admission: AdmissionController):
+    # несколько быстрых сообщений подряд склеиваются в один вопрос
+    batch = await coalescer.collect(message.from_user.id, message.text)
+    if batch is None:
+        return
+    question, batch_size = batch
+
+    # приветствия, контакты, запись — отвечаем шаблоном, LLM только для вопросов о курсах
+    intent = detect_intent(question, config.intents.max_words) if config.intents.enabled else None
+    if intent is not None:
+        work = answer_with_template(message, intent)
+    else:
+        work = answer_with_llm(message, question, config, admission)
+    await coalescer.run(message.from_user.id, batch_size, work)
 
 
 # Обработка нажатия кнопки "Посмотреть фото и видео с занятий"
 @user_router.callback_query(F.data=='view_media')
-async def view_media_response(callback_query: CallbackQuery):
-    redis_client = getattr(callback_query.bot,'redis_client')
-    photos = await redis_client.lrange('photos',0,-1)
-    videos = await redis_client.lrange('videos',0,-1)
-
-    videos = [InputMediaVideo(media=vid) for vid in videos]
-    photos = [InputMediaPhoto(media=photo) for photo in photos]
-    media = videos+photos
-    # Если в списке media от 2 до 10 элементов — отправляем их как медиа-группу
-    # Telegram API позволяет отправлять одновременно максимум 10 и минимум 2 элементов как группу
-    if 1 < len(media) <= 10:
-        await callback_query.message.answer_media_group(media)
-    elif len(media) >10:
-        for i in range(0,len(media),10): # если больше 10 - разбиваем на части
-            await callback_query.message.answer_media_group(media[i:i+10])
-
+async def view_media_response(callback_query: CallbackQuery, media: MediaCatalog):
+    # каталог уже разбит на альбомы (Telegram: от 2 до 10 элементов) и лежит в памяти
+    snapshot = await media.snapshot()
+    if not snapshot.parts:
+        await callback_query.message.answer("Нет медиа для отображения.")
     else:
-        # Обрабатываем все остальные случаи с помощью match-case
-        match len(media):
-            case 0:
-                # Если список media пуст — информируем пользователя
-                await callback_query.message.answer("Нет медиа для отображения.")
-            case 1:
-                # Если только один элемент — нужно проверить его тип
-                # и отправить соответствующим методом (отдельное фото или видео)
-                match media[0]:
-                    case InputMediaPhoto():
-                        # Отправляем фотографию
-                        await callback_query.message.answer_photo(media[0].media)
-                    case InputMediaVideo():
-                        # Отправляем видео
-                        await callback_query.message.answer_video(media[0].media)
+        await media.send(callback_query.message, snapshot.parts)
 
     await callback_query.answer()
 
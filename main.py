@@ -1,34 +1,102 @@
 import asyncio
 import logging
-import os
+import multiprocessing
+import signal
 import sys
+import time
+
+# время импорта модулей бота (LLM, langchain, faiss) — пишется в лог при старте
+_import_started = time.perf_counter()
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-import redis.asyncio as redis
 from aiogram.fsm.storage.redis import RedisStorage
+from aiohttp import web
 
-
-from config.config import load_config
+from config.config import Config, create_redis, load_config
 from handlers.user import user_router
 from handlers.admin import admin_router
+from LLM import llm
+from services.admins import AdminRegistry
+from services.admission import AdmissionController
+from services.broadcast import Broadcaster
+from services.debounce import MessageCoalescer
+from services.fsm_cache import CachedStorage
+from services.media import MediaCatalog
+from services.outbound import OutboundLimiter
+from services.users import UserRegistry, UserRegistryMiddleware
+from services.webhook import WebhookRouter, WorkerPool, create_worker_app, serve_worker
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # Логгер для вывода информации о работе бота
 logger = logging.getLogger(__name__)
 
-async def main():
+def setup_bot(config: Config) -> tuple[Dispatcher, Bot]:
+    """Диспетчер и бот одного процесса: сервисы, middleware, роутеры, старт и остановка."""
+    # Один пул соединений Redis на процесс: FSM, фильтры, хэндлеры и LLM
+    redis_client = create_redis(config.redis)
+    storage = RedisStorage(redis_client)
+    # состояние FSM читается на каждом сообщении — держим его копию в памяти
+    if config.fsm_cache.enabled:
+        storage = CachedStorage(storage, max_size=config.fsm_cache.max_size, ttl=config.fsm_cache.ttl)
 
+    # Список админов из Redis держим в памяти: фильтр IsAdmin проверяет каждое сообщение
+    admins = AdminRegistry(
+        redis_client,
+        refresh_interval=config.admin_cache.refresh_interval,
+        max_staleness=config.admin_cache.max_staleness,
+        names_ttl=config.admin_cache.names_ttl,
+        names_concurrency=config.admin_cache.names_concurrency,
+    )
 
-    # Подключаем Redis для хранения данных (например, фотографий)
-    redis_host = os.getenv("REDIS_HOST", "localhost")
-    redis_port = int(os.getenv("REDIS_PORT", 6379))
-    redis_client = redis.Redis(host=redis_host, port=redis_port,decode_responses=True)
-    storage = RedisStorage(redis_client)
+    # Фото и видео с занятий: атомарные изменения в Redis, готовые альбомы в памяти
+    media = MediaCatalog(
+        redis_client,
+        check_interval=config.media.check_interval,
+        send_concurrency=config.media.send_concurrency,
+        limit=config.media.limit,
+    )
 
-    # Создаем диспетчер для хэндлеров
-    dp = Dispatcher(storage=storage)
-    # Загружаем конфиг
-    config = load_config()
+    # Все исходящие запросы к Telegram идут через общий планировщик с лимитами
+    outbound = OutboundLimiter(
+        global_rate=config.outbound.global_rate,
+        private_rate=config.outbound.private_rate,
+        group_rate=config.outbound.group_rate,
+        chat_burst=config.outbound.chat_burst,
+        bulk_headroom=config.outbound.bulk_headroom,
+        max_retries=config.outbound.max_retries,
+    )
+
+    # Реестр пользователей для рассылок и сама рассылка (фоновая, с контрольными точками в Redis)
+    users = UserRegistry(redis_client)
+    broadcaster = Broadcaster(
+        redis_client,
+        users,
+        batch_size=config.broadcast.batch_size,
+        concurrency=config.broadcast.concurrency,
+        report_interval=config.broadcast.report_interval,
+    )
+
+    # Создаем диспетчер для хэндлеров (конфиг, Redis, админы, каталог медиа,
+    # склейщик сообщений, очереди к LLM и Telegram доступны хэндлерам и фильтрам как аргументы)
+    dp = Dispatcher(
+        storage=storage,
+        config=config,
+        redis=redis_client,
+        admins=admins,
+        media=media,
+        outbound=outbound,
+        users=users,
+        broadcaster=broadcaster,
+        coalescer=MessageCoalescer(config.debounce.window),
+        admission=AdmissionController(
+            max_active=config.admission.max_active,
+            max_queue=config.admission.max_queue,
+            max_per_user=config.admission.max_per_user,
+        ),
+    )
 
     # Настройка логирования
     logging.basicConfig(
@@ -41,18 +109,119 @@ async def main():
         token=config.bot.token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),  # HTML-разметка по умолчанию
     )
+    bot.session.middleware(outbound)
+
+    logger.info('Starting bot (imports took %.2fs)', IMPORT_SECONDS)
 
-    logger.info('Starting bot')
+    # Каждый, кто пишет боту, попадает в реестр пользователей
+    dp.update.outer_middleware(UserRegistryMiddleware(users))
 
     # Подключаем роутеры (админ и пользователь)
     dp.include_router(admin_router)
     dp.include_router(user_router)
 
-    setattr(bot, 'redis_client', redis_client)  # сохраняем клиент Redis в объекте бота
+    background_tasks: list[asyncio.Task] = []
+
+    # Старт: база знаний открывается до приёма сообщений, прогрев идёт параллельно с приёмом обновлений
+    async def on_startup():
+        await llm.startup(redis_client)
+        await admins.refresh()
+        await media.migrate()
+        await broadcaster.resume(bot)
+        admins.start()
+        if isinstance(storage, CachedStorage):
+            storage.start()
+        if config.giga.warmup:
+            background_tasks.append(asyncio.create_task(llm.warmup()))
+        # Фоновое обновление базы знаний: новая версия индекса подхватывается без перезапуска
+        if config.kb.watch_interval > 0:
+            background_tasks.append(asyncio.create_task(llm.watch_knowledge_base(config.kb.watch_interval)))
+
+    # Остановка: фоновые задачи отменяются, сервисы отписываются от Redis и
+    # сохраняют состояние; общий пул Redis затем закрывает хранилище FSM
+    async def on_shutdown():
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await admins.close()
+        await broadcaster.close()
+        await llm.shutdown()
 
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    # aiogram регистрирует закрытие хранилища FSM (а с ним и пула Redis) первым —
+    # переносим его в конец, чтобы сервисы останавливались с живым пулом
+    dp.shutdown.handlers.sort(key=lambda handler: handler.callback == dp.fsm.close)
+    return dp, bot
+
+
+async def main(config: Config):
+    dp, bot = setup_bot(config)
+    # вебхук, оставшийся от режима WEBHOOK, не даёт получать обновления polling'ом
+    await bot.delete_webhook()
     # Запуск polling (бот начинает получать сообщения)
     await dp.start_polling(bot)
 
+
+def run_worker(index: int) -> None:
+    """Процесс-обработчик вебхука: свой диспетчер и бот на 127.0.0.1."""
+    # Ctrl+C получает и входной процесс — он сам остановит обработчики через SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = load_config()
+    dp, bot = setup_bot(config)
+    app = create_worker_app(dp, bot, config.webhook)
+    asyncio.run(serve_worker(app, config.webhook.worker_port + index))
+
+
+def run_webhook(config: Config) -> None:
+    """
+    Режим вебхука: входной процесс принимает обновления от Telegram и
+    раздаёт их по пользователям в webhook.workers процессов-обработчиков.
+    """
+    settings = config.webhook
+    logging.basicConfig(
+        level=logging.getLevelName(level=config.log.level),
+        format=config.log.format,
+    )
+    context = multiprocessing.get_context('spawn')
+    pool = WorkerPool(
+        lambda index: context.Process(target=run_worker, args=(index,), name=f'bot-worker-{index}'),
+        workers=settings.workers,
+        # обработчик дорабатывает принятые обновления до drain_timeout, потом останавливает диспетчер
+        stop_timeout=settings.drain_timeout + 15,
+    )
+    router = WebhookRouter(settings, create_redis(config.redis))
+    app = router.create_app()
+    background_tasks: list[asyncio.Task] = []
+
+    async def on_startup(_: web.Application):
+        pool.start()
+        if not await router.wait_workers(timeout=300):
+            raise RuntimeError('Webhook workers did not start in time')
+        # обновления, накопленные у Telegram, не сбрасываются — их получат обработчики
+        async with Bot(token=config.bot.token) as bot:
+            await bot.set_webhook(f'{settings.url}{settings.path}', secret_token=settings.secret or None,
+                                  drop_pending_updates=False)
+        background_tasks.append(asyncio.create_task(pool.watch()))
+        logger.info('Webhook: %d workers ready, listening on %s:%s', settings.workers, settings.host, settings.port)
+
+    # к этому моменту входной порт уже закрыт, новые обновления Telegram придержит у себя
+    async def on_shutdown(_: web.Application):
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await pool.stop()
+        await router.redis.aclose()
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host=settings.host, port=settings.port, print=None)
+
 # Точка входа
 if __name__ == '__main__':
-    asyncio.run(main())
+    # Загружаем конфиг
+    config = load_config()
+    if config.webhook.enabled:
+        run_webhook(config)
+    else:
+        asyncio.run(main(config))
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class AdminRegistry:
+    """
+    Снимок множества админов из Redis в памяти процесса.
+
+    Проверка «админ ли это» — поиск в set без обращения к Redis. Снимок
+    перечитывается раз в refresh_interval секунд и сразу после сообщения в
+    канале channel, которое публикуют add/remove (в том числе другие воркеры).
+    Если Redis недоступен дольше max_staleness секунд, снимок считается
+    недействительным и админами из Redis никто не считается (fail-closed).
+
+    Имена админов для панели хранятся в хэше <key>:names (имя и время
+    записи) и считаются свежими names_ttl секунд.
+    """
+
+    def __init__(self, redis: Redis, key: str = "admins", refresh_interval: float = 60.0,
+                 max_staleness: float = 300.0, channel: str = "admins:changed",
+                 names_ttl: float = 24 * 3600, names_concurrency: int = 5):
+        self.redis = redis
+        self.key = key
+        self.names_key = f"{key}:names"
+        self.names_ttl = names_ttl
+        self.names_concurrency = names_concurrency
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.channel = channel
+        self._admins: frozenset[int] = frozenset()
+        self._refreshed_at: float | None = None
+        self._listener: asyncio.Task | None = None
+
+    def is_admin(self, user_id: int) -> bool:
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.max_staleness:
+            return False
+        return user_id in self._admins
+
+    async def refresh(self) -> bool:
+        """Перечитывает множество из Redis. False — Redis недоступен, снимок прежний."""
+        try:
+            members = await self.redis.smembers(self.key)
+        except RedisError as e:
+            logger.warning("Admin registry: refresh failed: %r", e)
+            return False
+        self._admins = frozenset(int(member) for member in members)
+        self._refreshed_at = time.monotonic()
+        return True
+
+    async def add(self, user_id: int, name: str | None = None) -> bool:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(self.key, user_id)
+            if name:
+                pipe.hset(self.names_key, str(user_id), self._encode_name(name))
+            added, *_ = await pipe.execute()
+        await self._changed()
+        return bool(added)
+
+    async def remove(self, user_id: int) -> bool:
+        """Удаляет админа; False — его не было в списке."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            removed, _ = await pipe.srem(self.key, user_id).hdel(self.names_key, str(user_id)).execute()
+        await self._changed()
+        return bool(removed)
+
+    async def _changed(self) -> None:
+        await self.refresh()
+        try:
+            await self.redis.publish(self.channel, self.key)
+        except RedisError as e:
+            # другие воркеры увидят изменение при плановом обновлении
+            logger.warning("Admin registry: change not published: %r", e)
+
+    # ---------------- имена для панели ----------------
+
+    def _encode_name(self, name: str) -> str:
+        return json.dumps({"name": name, "updated": time.time()}, ensure_ascii=False)
+
+    def _decode_name(self, raw: str | None) -> str | None:
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        if time.time() - record["updated"] > self.names_ttl:
+            return None
+        return record["name"]
+
+    async def names(self, bot: Bot) -> dict[int, str]:
+        """
+        Админы из Redis и их имена. Список и имена читаются одним запросом;
+        в Telegram (get_chat) идут только отсутствующие или устаревшие имена,
+        не больше names_concurrency одновременно.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            members, raw_names = await pipe.smembers(self.key).hgetall(self.names_key).execute()
+        names = {int(member): self._decode_name(raw_names.get(member)) for member in members}
+        missing = [user_id for user_id, name in names.items() if name is None]
+        if missing:
+            names.update(await self._resolve_names(bot, missing))
+        return dict(sorted(names.items(), key=lambda item: item[1].casefold()))
+
+    async def name(self, bot: Bot, user_id: int) -> str:
+        name = self._decode_name(await self.redis.hget(self.names_key, str(user_id)))
+        if name is None:
+            name = (await self._resolve_names(bot, [user_id]))[user_id]
+        return name
+
+    async def _resolve_names(self, bot: Bot, user_ids: list[int]) -> dict[int, str]:
+        semaphore = asyncio.Semaphore(self.names_concurrency)
+
+        async def resolve(user_id: int) -> str | None:
+            async with semaphore:
+                try:
+                    return (await bot.get_chat(user_id)).first_name
+                except TelegramAPIError as e:
+                    logger.warning("Admin registry: get_chat(%s) failed: %r", user_id, e)
+                    return None
+
+        resolved = dict(zip(user_ids, await asyncio.gather(*(resolve(user_id) for user_id in user_ids))))
+        found = {str(user_id): self._encode_name(name) for user_id, name in resolved.items() if name}
+        if found:
+            await self.redis.hset(self.names_key, mapping=found)
+        # без имени показываем id, в кэш такое не пишем
+        return {user_id: name or str(user_id) for user_id, name in resolved.items()}
+
+    # ---------------- фоновое обновление ----------------
+
+    def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # изменения до подписки могли быть пропущены
+                    await self.refresh()
+                    delay = 1.0
+                    next_refresh = time.monotonic() + self.refresh_interval
+                    while True:
+                        timeout = max(next_refresh - time.monotonic(), 0.0)
+                        message = await pubsub.get_message(timeout=min(timeout, 1.0))
+                        if message is not None or time.monotonic() >= next_refresh:
+                            await self.refresh()
+                            next_refresh = time.monotonic() + self.refresh_interval
+            except (RedisError, OSError) as e:
+                logger.warning("Admin registry: pub/sub disconnected (%r), retrying in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше. Новые диалоги обслуживаются раньше продолжений
+PRIORITY_NEW = 0
+PRIORITY_FOLLOW_UP = 1
+
+
+class AdmissionRejected(Exception):
+    """Очередь к LLM переполнена — запрос отклонён сразу, без ожидания."""
+
+
+@dataclass
+class AdmissionMetrics:
+    """Состояние очереди к LLM и накопленная статистика ожидания."""
+    active: int = 0
+    queued: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    last_wait: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.admitted if self.admitted else 0.0
+
+    def add_wait(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.last_wait = wait
+
+
+class AdmissionController:
+    """
+    Допуск запросов к LLM: не больше max_active одновременно, остальные ждут
+    в ограниченной очереди.
+
+    Внутри приоритета пользователи обслуживаются по кругу — по одному запросу
+    за раз, поэтому частые сообщения одного пользователя не задерживают
+    остальных. Если очередь заполнена (всего max_queue или max_per_user
+    у одного пользователя), запрос сразу отклоняется AdmissionRejected.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, max_per_user: int):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        # приоритет -> пользователь -> очередь ожидающих
+        self._waiters: dict[int, OrderedDict[int, deque[asyncio.Future]]] = {}
+        self.metrics = AdmissionMetrics()
+
+    def _user_queued(self, user_id: int) -> int:
+        return sum(len(users.get(user_id, ())) for users in self._waiters.values())
+
+    def _wake_next(self) -> None:
+        while self.metrics.active < self.max_active:
+            waiter = self._pop_next()
+            if waiter is None:
+                return
+            waiter.set_result(None)
+            self.metrics.active += 1
+
+    def _pop_next(self) -> asyncio.Future | None:
+        for priority in sorted(self._waiters):
+            users = self._waiters[priority]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                waiter = queue.popleft()
+                if queue:
+                    users.move_to_end(user_id)  # следующий запрос пользователя — в конец круга
+                else:
+                    del users[user_id]
+                self.metrics.queued -= 1
+                if not waiter.done():
+                    return waiter
+        return None
+
+    def _remove(self, priority: int, user_id: int, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(priority, {}).get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self.metrics.queued -= 1
+            if not queue:
+                del self._waiters[priority][user_id]
+
+    def has_free_slot(self) -> bool:
+        return self.metrics.active < self.max_active and not self.metrics.queued
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, priority: int = PRIORITY_FOLLOW_UP,
+                    waiting: AbstractAsyncContextManager | None = None):
+        """
+        Занимает место для запроса на время блока. waiting — контекст, в котором
+        проходит ожидание в очереди (например, статус «печатает…»); при
+        свободном месте он не открывается.
+        """
+        started = time.monotonic()
+        if self.has_free_slot():
+            self.metrics.active += 1
+        else:
+            if self.metrics.queued >= self.max_queue or self._user_queued(user_id) >= self.max_per_user:
+                self.metrics.rejected += 1
+                logger.warning('LLM queue is full (queued=%s, active=%s), rejecting user %s',
+                               self.metrics.queued, self.metrics.active, user_id)
+                raise AdmissionRejected()
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(waiter)
+            self.metrics.queued += 1
+            try:
+                async with waiting or nullcontext():
+                    await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # место уже выдано, но запрос отменён — отдаём его следующему
+                    self.metrics.active -= 1
+                    self._wake_next()
+                else:
+                    self._remove(priority, user_id, waiter)
+                raise
+
+        wait = time.monotonic() - started
+        self.metrics.add_wait(wait)
+        logger.debug('LLM admission: user=%s priority=%s wait=%.2fs active=%s queued=%s',
+                     user_id, priority, wait, self.metrics.active, self.metrics.queued)
+        try:
+            yield
+        finally:
+            self.metrics.active -= 1
+            self._wake_next()
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from redis.asyncio import Redis
+from redis.exceptions import LockError
+
+from services.outbound import bulk_sends
+from services.users import BLOCKED_KEY, USERS_KEY, UserRegistry
+
+logger = logging.getLogger(__name__)
+
+# HASH текущей рассылки: id, status (running, done, cancelled), что и кому
+# копировать, граница реестра, позиция в нём и счётчики. Позиция
+# сохраняется после каждой пачки — после перезапуска рассылка продолжается.
+JOB_KEY = "broadcast:job"
+LOCK_KEY = "broadcast:lock"
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class BroadcastProgress:
+    total: int
+    offset: int
+    sent: int
+    blocked: int
+    failed: int
+    rate: float
+    status: str
+
+    def format(self) -> str:
+        percent = 100 * self.offset / self.total if self.total else 100
+        titles = {RUNNING: 'идёт', DONE: 'завершена', CANCELLED: 'остановлена'}
+        return (
+            f'Рассылка {titles.get(self.status, self.status)}: {self.offset} из {self.total} ({percent:.0f}%)\n'
+            f'Доставлено: {self.sent}, заблокировали бота: {self.blocked}, ошибок: {self.failed}\n'
+            f'Скорость: {self.rate:.1f} сообщ./с'
+        )
+
+
+class Broadcaster:
+    """
+    Рассылка сообщения админа всем пользователям из реестра.
+
+    Сообщение копируется (copy_message), поэтому подходит текст, фото, видео
+    и документ. Пользователи перебираются пачками по batch_size в порядке
+    первого обращения; внутри пачки — до concurrency отправок сразу, темп
+    задаёт OutboundLimiter (рассылка идёт как bulk и не тормозит ответы).
+    Рассылку ведёт один воркер — тот, кто держит блокировку в Redis; если
+    он упал, блокировка истекает через lock_timeout, и перезапущенный
+    воркер (resume ждёт её не дольше lock_timeout) продолжает рассылку.
+    """
+
+    def __init__(self, redis: Redis, users: UserRegistry, batch_size: int = 200, concurrency: int = 30,
+                 report_interval: float = 10.0, lock_timeout: float = 60.0):
+        self.redis = redis
+        self.users = users
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.report_interval = report_interval
+        self.lock_timeout = lock_timeout
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def status(self) -> str | None:
+        return await self.redis.hget(JOB_KEY, 'status')
+
+    async def start(self, bot: Bot, admin_chat_id: int, from_chat_id: int, message_id: int) -> bool:
+        """Запускает новую рассылку; False — предыдущая ещё идёт."""
+        if await self.status() == RUNNING:
+            return False
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(JOB_KEY)
+            pipe.hset(JOB_KEY, mapping={
+                'id': uuid.uuid4().hex[:8],
+                'status': RUNNING,
+                'admin_chat_id': admin_chat_id,
+                'from_chat_id': from_chat_id,
+                'message_id': message_id,
+                # пользователи, пришедшие после запуска, в рассылку не попадают
+                'until': time.time(),
+                'offset': 0,
+                'sent': 0,
+                'blocked': 0,
+                'failed': 0,
+                'started_at': time.time(),
+            })
+            await pipe.execute()
+        self._spawn(bot)
+        return True
+
+    async def resume(self, bot: Bot) -> None:
+        """Продолжает незавершённую рассылку (вызывается при старте бота)."""
+        if await self.status() == RUNNING:
+            logger.info('Broadcast: resuming unfinished job')
+            # блокировка упавшего процесса ещё может быть жива — ждём, пока истечёт
+            self._spawn(bot, wait=self.lock_timeout)
+
+    async def cancel(self) -> bool:
+        if await self.status() != RUNNING:
+            return False
+        await self.redis.hset(JOB_KEY, 'status', CANCELLED)
+        return True
+
+    async def close(self) -> None:
+        # статус остаётся running — рассылка продолжится после перезапуска
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _spawn(self, bot: Bot, wait: float = 0.0) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run(bot, wait))
+
+    async def _run(self, bot: Bot, wait: float) -> None:
+        lock = self.redis.lock(LOCK_KEY, timeout=self.lock_timeout)
+        if not await lock.acquire(blocking=wait > 0, blocking_timeout=wait + 1):
+            logger.info('Broadcast: job is run by another worker')
+            return
+        try:
+            # пока ждали блокировку, рассылку могли завершить или остановить
+            if await self.status() == RUNNING:
+                await self._send_all(bot, lock)
+        except Exception:
+            logger.exception('Broadcast: job failed, will resume on next start')
+        finally:
+            with suppress(LockError):
+                await lock.release()
+
+    async def _send_all(self, bot: Bot, lock) -> None:
+        job = await self.redis.hgetall(JOB_KEY)
+        admin_chat_id, from_chat_id, message_id = (int(job[k]) for k in ('admin_chat_id', 'from_chat_id', 'message_id'))
+        until = float(job['until'])
+        offset = int(job['offset'])
+        total = await self.redis.zcount(USERS_KEY, '-inf', until)
+        counts = {'sent': int(job['sent']), 'blocked': int(job['blocked']), 'failed': int(job['failed'])}
+        started, sent_at_start = time.monotonic(), counts['sent']
+        status_message = await bot.send_message(
+            admin_chat_id,
+            f'Рассылка: продолжаю с {offset} из {total}' if offset else f'Рассылка: начинаю, получателей {total}',
+        )
+        last_report = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        def progress(status: str) -> BroadcastProgress:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            return BroadcastProgress(total=total, offset=offset, rate=(counts['sent'] - sent_at_start) / elapsed,
+                                     status=status, **counts)
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                try:
+                    await bot.copy_message(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id)
+                    return 'sent'
+                except TelegramForbiddenError:
+                    return 'blocked'
+                except TelegramBadRequest as e:
+                    # chat not found, user is deactivated — писать некому
+                    if 'chat not found' in e.message or 'deactivated' in e.message:
+                        return 'blocked'
+                    logger.warning('Broadcast: copy to %s failed: %r', user_id, e)
+                    return 'failed'
+                except TelegramAPIError as e:
+                    logger.warning('Broadcast: copy to %s failed: %r', user_id, e)
+                    return 'failed'
+
+        status = RUNNING
+        while True:
+            status = await self.status()
+            if status != RUNNING:
+                break
+            members = await self.redis.zrange(USERS_KEY, offset, offset + self.batch_size - 1, withscores=True)
+            batch = [int(member) for member, score in members if score <= until]
+            if not batch:
+                status = DONE
+                break
+            already_blocked = await self.redis.smismember(BLOCKED_KEY, batch)
+            recipients = [user_id for user_id, blocked in zip(batch, already_blocked) if not blocked]
+            with bulk_sends():
+                results = await asyncio.gather(*(send(user_id) for user_id in recipients))
+
+            newly_blocked = [user_id for user_id, result in zip(recipients, results) if result == 'blocked']
+            await self.users.mark_blocked(newly_blocked)
+            batch_counts = {
+                'sent': results.count('sent'),
+                'blocked': len(newly_blocked) + sum(already_blocked),
+                'failed': results.count('failed'),
+            }
+            offset += len(batch)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(JOB_KEY, 'offset', offset)
+                for name, value in batch_counts.items():
+                    pipe.hincrby(JOB_KEY, name, value)
+                    counts[name] += value
+                await pipe.execute()
+            await lock.reacquire()
+
+            if len(batch) < len(members):
+                # дальше — пользователи, пришедшие после запуска рассылки
+                status = DONE
+                break
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                with suppress(TelegramAPIError):
+                    await status_message.edit_text(progress(RUNNING).format())
+
+        if status == DONE:
+            await self.redis.hset(JOB_KEY, mapping={'status': DONE, 'finished_at': time.time()})
+        final = progress(status)
+        logger.info('Broadcast: %s, offset=%s/%s sent=%s blocked=%s failed=%s, %.1f msg/s',
+                    status, offset, total, counts['sent'], counts['blocked'], counts['failed'], final.rate)
+        with suppress(TelegramAPIError):
+            await status_message.edit_text(final.format())
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _UserState:
+    texts: list[str] = field(default_factory=list)
+    generation: int = 0
+    inflight: asyncio.Task | None = None
+
+
+class MessageCoalescer:
+    """
+    Склейка быстрых сообщений одного пользователя в один вопрос.
+
+    Каждое сообщение ждёт window секунд; если за это время пришло следующее —
+    текущее ничего не делает, а его текст уходит в общий вопрос. Новое
+    сообщение отменяет уже запущенный ответ: вопрос ещё не дописан, и
+    отвечать на его часть бессмысленно. Тексты снимаются с очереди только
+    когда ответ на них завершился.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._states: dict[int, _UserState] = {}
+
+    async def collect(self, user_id: int, text: str) -> tuple[str, int] | None:
+        """
+        Добавляет сообщение и ждёт окончания окна. Возвращает (склеенный
+        вопрос, число вошедших сообщений) или None, если вопрос подхватит
+        более позднее сообщение.
+        """
+        state = self._states.setdefault(user_id, _UserState())
+        state.texts.append(text)
+        state.generation += 1
+        generation = state.generation
+
+        if state.inflight is not None and not state.inflight.done():
+            logger.debug('User %s keeps typing, cancelling in-flight answer', user_id)
+            state.inflight.cancel()
+
+        await asyncio.sleep(self.window)
+        if state.generation != generation:
+            return None
+        return '\n'.join(state.texts), len(state.texts)
+
+    async def run(self, user_id: int, batch_size: int, work: Awaitable) -> bool:
+        """
+        Выполняет ответ на склеенный вопрос. Возвращает False, если ответ
+        отменён новым сообщением пользователя.
+        """
+        state = self._states[user_id]
+        task = asyncio.ensure_future(work)
+        state.inflight = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            # отменили сам хэндлер (остановка бота) — пробрасываем дальше
+            if asyncio.current_task().cancelling():
+                raise
+            return False
+        finally:
+            if state.inflight is task:
+                state.inflight = None
+            if not task.cancelled():
+                del state.texts[:batch_size]
+            if not state.texts and state.inflight is None:
+                self._states.pop(user_id, None)
+        return True
@@ -0,0 +1,166 @@
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Значение, которого нет в кэше (None — законное состояние default_state)
+_MISSING = object()
+
+
+class _TTLCache:
+    """LRU с TTL на запись; хранит и None."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CachedStorage(BaseStorage):
+    """
+    FSM-хранилище в два уровня: LRU в памяти процесса перед RedisStorage.
+
+    Чтения состояния и данных отдаются из памяти (почти все пользователи
+    всё время в default_state, и каждое сообщение читает его), запись идёт
+    сквозная: сначала в Redis, затем в локальный кэш. Об изменении ключа
+    воркер сообщает остальным через pub/sub, и они сбрасывают свою копию;
+    короткий TTL ограничивает расхождение, если сообщение потерялось.
+    """
+
+    def __init__(self, storage: RedisStorage, max_size: int = 10000, ttl: float = 30.0,
+                 channel: str = "fsm:invalidate"):
+        self.storage = storage
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self._states = _TTLCache(max_size, ttl)
+        self._data = _TTLCache(max_size, ttl)
+        self._listener: asyncio.Task | None = None
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _key(self, key: StorageKey) -> str:
+        return self.storage.key_builder.build(key)
+
+    # ---------------- BaseStorage ----------------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        cache_key = self._key(key)
+        self._states.set(cache_key, state.state if isinstance(state, State) else state)
+        await self._publish(cache_key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        cache_key = self._key(key)
+        state = self._states.get(cache_key)
+        if state is _MISSING:
+            self.stats["misses"] += 1
+            state = await self.storage.get_state(key)
+            # пока шёл запрос, ключ мог быть записан этим же воркером — его значение новее
+            if self._states.get(cache_key) is _MISSING:
+                self._states.set(cache_key, state)
+        else:
+            self.stats["hits"] += 1
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.storage.set_data(key, data)
+        cache_key = self._key(key)
+        self._data.set(cache_key, copy.deepcopy(dict(data)))
+        await self._publish(cache_key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        cache_key = self._key(key)
+        data = self._data.get(cache_key)
+        if data is _MISSING:
+            self.stats["misses"] += 1
+            data = await self.storage.get_data(key)
+            # пока шёл запрос, ключ мог быть записан этим же воркером — его значение новее
+            if self._data.get(cache_key) is _MISSING:
+                self._data.set(cache_key, data)
+        else:
+            self.stats["hits"] += 1
+        # вызывающий код (update_data) меняет полученный словарь
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        await self.storage.close()
+
+    # ---------------- инвалидация между воркерами ----------------
+
+    def start(self) -> None:
+        """Запускает подписку на изменения от других воркеров."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    def invalidate(self, cache_key: str) -> None:
+        self._states.pop(cache_key)
+        self._data.pop(cache_key)
+        self.stats["invalidations"] += 1
+
+    async def _publish(self, cache_key: str) -> None:
+        try:
+            await self.storage.redis.publish(self.channel, f"{self.worker_id} {cache_key}")
+        except RedisError as e:
+            # запись в Redis уже прошла; остальные воркеры увидят её по TTL
+            logger.warning("FSM cache: invalidation for %s not published: %r", cache_key, e)
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                async with self.storage.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # пока подписки не было, сообщения могли потеряться
+                    self._states.clear()
+                    self._data.clear()
+                    delay = 1.0
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is None:
+                            continue
+                        sender, _, cache_key = message["data"].partition(" ")
+                        if sender != self.worker_id:
+                            self.invalidate(cache_key)
+            except (RedisError, OSError) as e:
+                logger.warning("FSM cache: pub/sub disconnected (%r), retrying in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
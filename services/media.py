@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram.types import InputMediaPhoto, InputMediaVideo, Message
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Хранилище фото и видео в Redis:
+#   media:version            — версия каталога, растёт при каждом изменении
+#   media:next_id            — счётчик стабильных id
+#   media:<вид>              — ZSET id элементов вида (photo, video); score = id, то есть порядок добавления
+#   media:<вид>:unique       — HASH file_unique_id -> id, чтобы один файл не добавили дважды
+#   media:item:<id>          — HASH метаданных: kind, file_id, file_unique_id, added_by, added_at
+# Все изменения — Lua-скрипты: проверка лимита, запись и смена версии
+# выполняются атомарно, одновременные правки двух админов не мешают друг другу.
+# Ключи элементов собираются внутри скриптов, поэтому хранилище рассчитано
+# на одиночный Redis, а не на кластер.
+VERSION_KEY = "media:version"
+NEXT_ID_KEY = "media:next_id"
+ITEM_PREFIX = "media:item:"
+PHOTO = "photo"
+VIDEO = "video"
+# Списки, в которых медиа хранились раньше (переносятся в migrate)
+LEGACY_KEYS = {PHOTO: "photos", VIDEO: "videos"}
+# Telegram принимает в альбоме от 2 до 10 элементов
+ALBUM_SIZE = 10
+
+InputMedia = InputMediaPhoto | InputMediaVideo
+
+# KEYS: набор вида, unique, next_id, version; ARGV: лимит, kind, file_id, file_unique_id, added_by, added_at, префикс
+ADD_SCRIPT = """
+local existing = redis.call('HGET', KEYS[2], ARGV[4])
+if existing then
+    return {'duplicate', existing}
+end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return {'full', false}
+end
+local id = redis.call('INCR', KEYS[3])
+redis.call('HSET', ARGV[7] .. id, 'kind', ARGV[2], 'file_id', ARGV[3], 'file_unique_id', ARGV[4],
+           'added_by', ARGV[5], 'added_at', ARGV[6])
+redis.call('ZADD', KEYS[1], id, id)
+redis.call('HSET', KEYS[2], ARGV[4], id)
+redis.call('INCR', KEYS[4])
+return {'ok', tostring(id)}
+"""
+
+# KEYS: набор вида, unique, version; ARGV: id, префикс. Возвращает file_id удалённого или nil
+REMOVE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return false
+end
+local item = ARGV[2] .. ARGV[1]
+local fields = redis.call('HMGET', item, 'file_id', 'file_unique_id')
+redis.call('DEL', item)
+if fields[2] then
+    redis.call('HDEL', KEYS[2], fields[2])
+end
+redis.call('INCR', KEYS[3])
+return fields[1]
+"""
+
+# KEYS: version, наборы видов; ARGV: префикс. Возвращает версию и по каждому виду [id, file_id, ...]
+SNAPSHOT_SCRIPT = """
+local result = {redis.call('GET', KEYS[1]) or false}
+for i = 2, #KEYS do
+    local flat = {}
+    for _, id in ipairs(redis.call('ZRANGE', KEYS[i], 0, -1)) do
+        table.insert(flat, id)
+        table.insert(flat, redis.call('HGET', ARGV[1] .. id, 'file_id') or '')
+    end
+    table.insert(result, flat)
+end
+return result
+"""
+
+# KEYS: старый список, набор вида, next_id, version; ARGV: kind, префикс.
+# Переносит старый список, если новый набор ещё пуст; список сохраняется как <ключ>:legacy
+MIGRATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local file_ids = redis.call('LRANGE', KEYS[1], 0, -1)
+for _, file_id in ipairs(file_ids) do
+    local id = redis.call('INCR', KEYS[3])
+    redis.call('HSET', ARGV[2] .. id, 'kind', ARGV[1], 'file_id', file_id)
+    redis.call('ZADD', KEYS[2], id, id)
+end
+redis.call('RENAME', KEYS[1], KEYS[1] .. ':legacy')
+redis.call('INCR', KEYS[4])
+return #file_ids
+"""
+
+
+def kind_key(kind: str) -> str:
+    return f"media:{kind}"
+
+
+def unique_key(kind: str) -> str:
+    return f"media:{kind}:unique"
+
+
+@dataclass(frozen=True)
+class MediaItem:
+    id: str
+    kind: str
+    file_id: str
+
+    def as_input(self) -> InputMedia:
+        return InputMediaPhoto(media=self.file_id) if self.kind == PHOTO else InputMediaVideo(media=self.file_id)
+
+
+@dataclass(frozen=True)
+class AddResult:
+    status: str            # ok, duplicate или full
+    id: str | None = None
+
+
+@dataclass(frozen=True)
+class MediaSnapshot:
+    """Каталог одной версии, уже разбитый на готовые к отправке части."""
+    version: str | None
+    items: dict[str, tuple[MediaItem, ...]]
+    parts: tuple[tuple[InputMedia, ...], ...]
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+
+def split_albums(media: list[InputMedia]) -> tuple[tuple[InputMedia, ...], ...]:
+    """Части по ALBUM_SIZE; одиночный остаток отправляется отдельным сообщением."""
+    parts = [tuple(media[i:i + ALBUM_SIZE]) for i in range(0, len(media), ALBUM_SIZE)]
+    if len(parts) > 1 and len(parts[-1]) == 1:
+        # 11 элементов — это 10 + 1; лучше 9 + 2, чтобы не было одиночного сообщения
+        parts[-2:] = [parts[-2][:-1], parts[-2][-1:] + parts[-1]]
+    return tuple(parts)
+
+
+class MediaCatalog:
+    """
+    Фото и видео с занятий: атомарные изменения в Redis и копия каталога
+    в памяти процесса, готовая к отправке.
+
+    Версия в Redis сверяется не чаще раза в check_interval секунд; каталог
+    перечитывается одним вызовом скрипта, только если версия изменилась.
+    """
+
+    def __init__(self, redis: Redis, check_interval: float = 5.0, send_concurrency: int = 3, limit: int = 10):
+        self.redis = redis
+        self.check_interval = check_interval
+        self.send_concurrency = send_concurrency
+        self.limit = limit
+        self._add = redis.register_script(ADD_SCRIPT)
+        self._remove = redis.register_script(REMOVE_SCRIPT)
+        self._snapshot_script = redis.register_script(SNAPSHOT_SCRIPT)
+        self._migrate = redis.register_script(MIGRATE_SCRIPT)
+        self._snapshot = MediaSnapshot(version=None, items={}, parts=())
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    # ---------------- изменения (админ) ----------------
+
+    async def add(self, kind: str, file_id: str, file_unique_id: str, added_by: int) -> AddResult:
+        """Добавляет файл, если вид ещё не заполнен до limit и такого файла нет."""
+        status, media_id = await self._add(
+            keys=[kind_key(kind), unique_key(kind), NEXT_ID_KEY, VERSION_KEY],
+            args=[self.limit, kind, file_id, file_unique_id, added_by, int(time.time()), ITEM_PREFIX],
+        )
+        self._loaded = False
+        return AddResult(status=status, id=media_id)
+
+    async def remove(self, kind: str, media_id: str) -> str | None:
+        """Удаляет элемент по id; возвращает его file_id или None, если его уже нет."""
+        file_id = await self._remove(
+            keys=[kind_key(kind), unique_key(kind), VERSION_KEY],
+            args=[media_id, ITEM_PREFIX],
+        )
+        self._loaded = False
+        return file_id
+
+    async def migrate(self) -> None:
+        """Переносит фото и видео из старых списков photos/videos (однократно)."""
+        for kind, legacy_key in LEGACY_KEYS.items():
+            moved = await self._migrate(
+                keys=[legacy_key, kind_key(kind), NEXT_ID_KEY, VERSION_KEY],
+                args=[kind, ITEM_PREFIX],
+            )
+            if moved:
+                logger.info('Media catalog: migrated %d items from %s', moved, legacy_key)
+
+    # ---------------- чтение ----------------
+
+    async def snapshot(self) -> MediaSnapshot:
+        if self._loaded and time.monotonic() - self._checked_at < self.check_interval:
+            return self._snapshot
+        async with self._lock:
+            if self._loaded and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+            if self._loaded and await self.redis.get(VERSION_KEY) == self._snapshot.version:
+                self._checked_at = time.monotonic()
+                return self._snapshot
+            kinds = (VIDEO, PHOTO)
+            version, *flat = await self._snapshot_script(
+                keys=[VERSION_KEY] + [kind_key(kind) for kind in kinds],
+                args=[ITEM_PREFIX],
+            )
+            items = {
+                kind: tuple(MediaItem(id=pairs[i], kind=kind, file_id=pairs[i + 1]) for i in range(0, len(pairs), 2))
+                for kind, pairs in zip(kinds, flat)
+            }
+            media = [item.as_input() for kind in kinds for item in items[kind]]
+            self._snapshot = MediaSnapshot(version=version, items=items, parts=split_albums(media))
+            self._loaded = True
+            self._checked_at = time.monotonic()
+            logger.info('Media catalog: version %s, %d items', version, len(self._snapshot))
+            return self._snapshot
+
+    async def items(self, kind: str) -> tuple[MediaItem, ...]:
+        return (await self.snapshot()).items.get(kind, ())
+
+    # ---------------- отправка ----------------
+
+    async def send(self, message: Message, parts: tuple[tuple[InputMedia, ...], ...]) -> None:
+        """Отправляет части каталога в чат, не больше send_concurrency одновременно."""
+        semaphore = asyncio.Semaphore(self.send_concurrency)
+
+        async def send_part(part: tuple[InputMedia, ...]) -> None:
+            # лимиты Telegram и повтор после 429 — в OutboundLimiter
+            async with semaphore:
+                await _send_part(message, part)
+
+        await asyncio.gather(*(send_part(part) for part in parts))
+
+    async def send_items(self, message: Message, items: tuple[MediaItem, ...]) -> None:
+        await self.send(message, split_albums([item.as_input() for item in items]))
+
+
+async def _send_part(message: Message, part: tuple[InputMedia, ...]) -> None:
+    if len(part) > 1:
+        await message.answer_media_group(list(part))
+    elif isinstance(part[0], InputMediaPhoto):
+        await message.answer_photo(part[0].media)
+    else:
+        await message.answer_video(part[0].media)
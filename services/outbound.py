@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendChatAction, SendMediaGroup, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше. Ответы пользователям идут раньше рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Методы, которые отправляют или меняют сообщения и попадают под лимиты Telegram
+LIMITED_PREFIXES = ('Send', 'Copy', 'Forward', 'Edit')
+# Правки (стриминг ответа, статус рассылки) лимитируются отдельно от новых сообщений
+EDIT_PREFIX = 'Edit'
+
+_priority: ContextVar[int] = ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+_retry: ContextVar[bool] = ContextVar('outbound_retry', default=True)
+
+
+@contextmanager
+def bulk_sends():
+    """Отправки внутри блока — массовые: уступают ответам пользователям."""
+    token = _priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def without_retry():
+    """Запросы внутри блока не повторяются после 429 — TelegramRetryAfter сразу уходит вызывающему."""
+    token = _retry.set(False)
+    try:
+        yield
+    finally:
+        _retry.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов: rate в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # ожидающие получают токены по очереди (asyncio.Lock — FIFO)
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """Сколько секунд ждать, пока хватит токенов на cost."""
+        self._refill(now)
+        missing = max(min(cost, self.capacity) - self.tokens, 0.0)
+        return max(missing / self.rate, self.blocked_until - now)
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+@dataclass
+class OutboundMetrics:
+    """Состояние очереди исходящих запросов к Telegram."""
+    sent: int = 0
+    waiting_interactive: int = 0
+    waiting_bulk: int = 0
+    throttled: int = 0
+    total_delay: float = 0.0
+    max_delay: float = 0.0
+    retry_after: int = 0
+    last_retry_after: float = 0.0
+    failed: int = 0
+
+    @property
+    def avg_delay(self) -> float:
+        return self.total_delay / self.throttled if self.throttled else 0.0
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Планировщик исходящих сообщений на уровне сессии бота: через него
+    проходят все message.answer, правки, альбомы и рассылки.
+
+    Перед отправкой запрос берёт токены из общего ведра (лимит бота) и из
+    ведра чата (личные чаты и группы ограничены по-разному). Альбом для чата —
+    одно сообщение, а в общем ведре стоит столько токенов, сколько в нём
+    элементов. Правки сообщений берут токены из своего ведра чата и не
+    конкурируют с новыми сообщениями; SendChatAction не лимитируется.
+    Массовые отправки (bulk_sends) не трогают запас bulk_headroom общего
+    ведра — он остаётся ответам пользователям, и рассылка не задерживает
+    их. На 429 чат (или весь
+    бот, если чат неизвестен) блокируется на retry_after, и запрос
+    повторяется до max_retries раз (кроме запросов в блоке without_retry).
+    """
+
+    def __init__(self, global_rate: float = 30.0, private_rate: float = 1.0, group_rate: float = 20 / 60,
+                 chat_burst: float = 3.0, bulk_headroom: float = 0.2, max_retries: int = 3,
+                 max_chats: int = 10000):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self.bulk_reserve = global_rate * bulk_headroom
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._edits: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self.metrics = OutboundMetrics()
+
+    def _chat_bucket(self, chat_id: int | str, edit: bool = False) -> TokenBucket:
+        buckets = self._edits if edit else self._chats
+        bucket = buckets.get(chat_id)
+        if bucket is None:
+            # id групп и каналов отрицательные, @username — только у публичных чатов
+            private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.private_rate if private else self.group_rate
+            bucket = buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+            while len(buckets) > self.max_chats:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(chat_id)
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if isinstance(method, SendChatAction) or not type(method).__name__.startswith(LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        # альбом — одно сообщение в чат, но каждый элемент идёт в общий лимит бота
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        edit = type(method).__name__.startswith(EDIT_PREFIX)
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, cost, priority, edit)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.metrics.retry_after += 1
+                self.metrics.last_retry_after = e.retry_after
+                (self._chat_bucket(chat_id, edit) if chat_id is not None else self._global).block(e.retry_after)
+                if not _retry.get():
+                    raise
+                if attempt == self.max_retries:
+                    self.metrics.failed += 1
+                    raise
+                logger.warning('Outbound: %s to %s throttled by Telegram, retry in %ss',
+                               type(method).__name__, chat_id, e.retry_after)
+                continue
+            self.metrics.sent += 1
+            return response
+
+    async def _acquire(self, chat_id: int | str | None, cost: int, priority: int, edit: bool = False) -> None:
+        chat = self._chat_bucket(chat_id, edit) if chat_id is not None else None
+        waiting = 'waiting_interactive' if priority == PRIORITY_INTERACTIVE else 'waiting_bulk'
+        started = time.monotonic()
+        setattr(self.metrics, waiting, getattr(self.metrics, waiting) + 1)
+        try:
+            # сообщения в один чат уходят в порядке вызова
+            async with chat.lock if chat is not None else nullcontext():
+                while True:
+                    now = time.monotonic()
+                    reserve = self.bulk_reserve if priority == PRIORITY_BULK else 0.0
+                    wait = self._global.delay(cost + reserve, now)
+                    if chat is not None:
+                        wait = max(wait, chat.delay(1, now))
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                self._global.take(cost)
+                if chat is not None:
+                    chat.take(1)
+        finally:
+            setattr(self.metrics, waiting, getattr(self.metrics, waiting) - 1)
+
+        delay = time.monotonic() - started
+        if delay > 0.001:
+            self.metrics.throttled += 1
+            self.metrics.total_delay += delay
+            self.metrics.max_delay = max(self.metrics.max_delay, delay)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from services.outbound import without_retry
+
+logger = logging.getLogger(__name__)
+
+# Telegram не принимает сообщения длиннее 4096 символов
+MAX_MESSAGE_LENGTH = 4096
+
+
+async def _edit(message: Message, text: str, **kwargs) -> None:
+    """Правка сообщения без падения на 'message is not modified'."""
+    try:
+        await message.edit_text(text=text[:MAX_MESSAGE_LENGTH], **kwargs)
+    except TelegramBadRequest as e:
+        if 'message is not modified' not in str(e):
+            raise
+
+
+async def stream_to_message(
+    message: Message,
+    chunks: AsyncIterator[str],
+    edit_interval: float,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    empty_text: str = '…',
+) -> str:
+    """
+    Выводит потоковый ответ в уже отправленное сообщение-заглушку.
+
+    Промежуточные правки идут не чаще одного раза в edit_interval секунд и без
+    разметки (незакрытые HTML-теги в середине ответа ломают parse_mode).
+    Итоговый текст отправляется с разметкой по умолчанию и клавиатурой.
+    """
+    loop = asyncio.get_running_loop()
+    text = ''
+    shown = ''
+    # первая порция текста показывается сразу, дальше — не чаще edit_interval
+    next_edit_at = loop.time()
+
+    async for chunk in chunks:
+        text += chunk
+        if loop.time() < next_edit_at or not text.strip() or text == shown:
+            continue
+        try:
+            # промежуточную правку не ждём и не повторяем: на 429 её просто пропускаем
+            with without_retry():
+                await _edit(message, text, parse_mode=None)
+            shown = text
+            next_edit_at = loop.time() + edit_interval
+        except TelegramRetryAfter as e:
+            # превысили лимит правок — просто пропускаем промежуточные обновления
+            logger.warning('Stream edit throttled for %s s', e.retry_after)
+            next_edit_at = loop.time() + e.retry_after
+
+    if not text.strip():
+        text = empty_text
+
+    try:
+        await _edit(message, text, reply_markup=reply_markup)
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        await _edit(message, text, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        # ответ модели оказался невалидным HTML — показываем как обычный текст
+        await _edit(message, text, parse_mode=None, reply_markup=reply_markup)
+    return text
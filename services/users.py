@@ -0,0 +1,75 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# ZSET: id пользователя -> время первого обращения к боту. Порядок по времени
+# стабилен (новые пользователи добавляются в конец), поэтому рассылка может
+# идти по позиции и продолжаться с сохранённого места.
+USERS_KEY = "users"
+# SET: пользователи, которым бот не может писать (заблокировали бота, удалили аккаунт)
+BLOCKED_KEY = "users:blocked"
+
+
+class UserRegistry:
+    """
+    Реестр пользователей бота для рассылок.
+
+    В Redis пишется только первое сообщение пользователя после запуска
+    процесса: уже виденные id хранятся в памяти, и остальные сообщения
+    не стоят запросов к Redis.
+    """
+
+    def __init__(self, redis: Redis, seen_cache_size: int = 100000):
+        self.redis = redis
+        self.seen_cache_size = seen_cache_size
+        self._seen: set[int] = set()
+
+    async def touch(self, user_id: int) -> None:
+        if user_id in self._seen:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            # NX: время первого обращения не меняется, место в очереди рассылки тоже
+            pipe.zadd(USERS_KEY, {user_id: time.time()}, nx=True)
+            # написал боту — значит, снова доступен
+            pipe.srem(BLOCKED_KEY, user_id)
+            await pipe.execute()
+        if len(self._seen) >= self.seen_cache_size:
+            self._seen.clear()
+        self._seen.add(user_id)
+
+    async def count(self) -> int:
+        return await self.redis.zcard(USERS_KEY)
+
+    async def mark_blocked(self, user_ids: list[int]) -> None:
+        if user_ids:
+            await self.redis.sadd(BLOCKED_KEY, *user_ids)
+            self._seen.difference_update(user_ids)
+
+
+class UserRegistryMiddleware(BaseMiddleware):
+    """Записывает в реестр каждого пользователя, от которого пришло событие."""
+
+    def __init__(self, registry: UserRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get('event_from_user')
+        if user is not None and not user.is_bot:
+            try:
+                await self.registry.touch(user.id)
+            except RedisError as e:
+                # реестр нужен только для рассылок — ответ пользователю важнее
+                logger.warning('User registry: %s not recorded: %r', user.id, e)
+        return await handler(event, data)
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+from contextlib import suppress
+from multiprocessing.process import BaseProcess
+from typing import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config.config import WebhookSettings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# SET NX с TTL: update_id, уже переданные обработчику
+DEDUP_PREFIX = "webhook:update:"
+
+
+def update_user_id(update: dict) -> int | None:
+    """Пользователь (или чат), к которому относится обновление."""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for field in ("from", "user"):
+            if isinstance(payload.get(field), dict):
+                return payload[field]["id"]
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if isinstance(chat, dict):
+            return chat["id"]
+    return None
+
+
+def worker_for(update: dict, workers: int) -> int:
+    """Номер обработчика: все обновления одного пользователя — в один процесс."""
+    user_id = update_user_id(update)
+    return (user_id if user_id is not None else update["update_id"]) % workers
+
+
+class WebhookRouter:
+    """
+    Входной процесс вебхука: принимает обновления от Telegram и передаёт
+    каждое обработчику по номеру пользователя.
+
+    Один пользователь всегда попадает в один процесс, поэтому склейка
+    сообщений, очередь к LLM, кэш FSM и отмена ответа видят все его
+    обновления. Обновления одного пользователя передаются обработчику по
+    одному, в том порядке, в каком пришли; обрабатываются они, как и при
+    polling, параллельными задачами — порядок гарантирован для доставки,
+    а не для завершения хэндлеров (на этом держится склейка сообщений).
+    Повтор уже переданного update_id (Telegram
+    повторяет запрос, если не дождался ответа) отбрасывается по Redis.
+    Если обработчик недоступен, Telegram получает 503 и повторит позже.
+    """
+
+    def __init__(self, settings: WebhookSettings, redis: Redis):
+        self.settings = settings
+        self.redis = redis
+        self._session: ClientSession | None = None
+        self._user_locks: dict[int, asyncio.Lock] = {}
+        self._waiters: dict[int, int] = {}
+
+    def worker_url(self, index: int) -> str:
+        return f"http://127.0.0.1:{self.settings.worker_port + index}{self.settings.path}"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.settings.secret and request.headers.get(SECRET_HEADER) != self.settings.secret:
+            return web.Response(body="Unauthorized", status=401)
+        body = await request.read()
+        try:
+            update = json.loads(body)
+            update_id = update["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return web.Response(body="Bad Request", status=400)
+
+        key = update_user_id(update) or update_id
+        lock = self._user_locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                return await self._forward(update, update_id, body)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key], self._user_locks[key]
+
+    async def _forward(self, update: dict, update_id: int, body: bytes) -> web.Response:
+        dedup_key = f"{DEDUP_PREFIX}{update_id}"
+        try:
+            if not await self.redis.set(dedup_key, 1, nx=True, ex=self.settings.dedup_ttl):
+                logger.info("Webhook: update %s already delivered, skipped", update_id)
+                return web.json_response({})
+        except RedisError as e:
+            # без Redis возможен повтор, но не потеря обновления
+            logger.warning("Webhook: dedup check failed: %r", e)
+
+        index = worker_for(update, self.settings.workers)
+        headers = {"Content-Type": "application/json"}
+        if self.settings.secret:
+            headers[SECRET_HEADER] = self.settings.secret
+        try:
+            async with self._session.post(self.worker_url(index), data=body, headers=headers) as response:
+                if response.status == 200:
+                    return web.json_response({})
+                logger.warning("Webhook: worker %s answered %s to update %s", index, response.status, update_id)
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Webhook: worker %s unavailable for update %s: %r", index, update_id, e)
+        # обновление не принято — пусть Telegram повторит
+        with suppress(RedisError):
+            await self.redis.delete(dedup_key)
+        return web.Response(body="Service Unavailable", status=503)
+
+    async def wait_workers(self, timeout: float) -> bool:
+        """Ждёт, пока все обработчики начнут слушать порты (то есть закончат старт)."""
+        deadline = time.monotonic() + timeout
+        for index in range(self.settings.workers):
+            while True:
+                try:
+                    _, writer = await asyncio.open_connection("127.0.0.1", self.settings.worker_port + index)
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        return False
+                    await asyncio.sleep(0.5)
+                    continue
+                writer.close()
+                break
+        return True
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("POST", self.settings.path, self.handle)
+
+        async def on_startup(_: web.Application) -> None:
+            # обработчик отвечает сразу, не дожидаясь ответа пользователю
+            self._session = ClientSession(timeout=ClientTimeout(total=10))
+
+        async def on_cleanup(_: web.Application) -> None:
+            await self._session.close()
+
+        app.on_startup.append(on_startup)
+        app.on_cleanup.append(on_cleanup)
+        return app
+
+
+class WorkerPool:
+    """Процессы-обработчики: перезапускает упавшие и останавливает все с ожиданием."""
+
+    def __init__(self, spawn: Callable[[int], BaseProcess], workers: int, stop_timeout: float):
+        self.spawn = spawn
+        self.stop_timeout = stop_timeout
+        self.processes: list[BaseProcess] = [spawn(index) for index in range(workers)]
+        self._stopping = False
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    async def watch(self, interval: float = 5.0) -> None:
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if not self._stopping and not process.is_alive():
+                    logger.warning("Webhook: worker %s exited with %s, restarting", index, process.exitcode)
+                    self.processes[index] = self.spawn(index)
+                    self.processes[index].start()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        # SIGTERM: обработчик перестаёт принимать обновления и дорабатывает принятые
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for process in self.processes:
+            await asyncio.to_thread(process.join, max(deadline - time.monotonic(), 0.0))
+            if process.is_alive():
+                logger.warning("Webhook: worker %s did not stop in time, killing", process.name)
+                process.kill()
+                await asyncio.to_thread(process.join)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука, который сам учитывает принятые обновления: каждое
+    ставится в обработку отдельной задачей, запрос подтверждается сразу,
+    а drain дожидается задач при остановке.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str | None = None):
+        super().__init__(dispatcher, bot, secret_token=secret_token)
+        self.in_flight: set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get(SECRET_HEADER, ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(self._feed(bot, update))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        return web.json_response({})
+
+    async def _feed(self, bot: Bot, update: dict) -> None:
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        # хэндлер мог вернуть метод вместо вызова — как в SimpleRequestHandler
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def drain(self, timeout: float) -> None:
+        """Ждёт обработки принятых обновлений; не успевшие за timeout отменяются."""
+        tasks = set(self.in_flight)
+        if not tasks:
+            return
+        logger.info("Webhook: draining %d updates", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning("Webhook: %d updates not finished in %.0fs, cancelling", len(pending), timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def create_worker_app(dp: Dispatcher, bot: Bot, settings: WebhookSettings) -> web.Application:
+    """
+    Приложение процесса-обработчика. Обновление ставится в обработку и
+    принимается сразу; при остановке принятые обновления дорабатываются
+    (до drain_timeout), и только потом останавливается диспетчер.
+    """
+    app = web.Application()
+    handler = DrainingRequestHandler(dp, bot, secret_token=settings.secret or None)
+
+    async def drain(_: web.Application) -> None:
+        await handler.drain(settings.drain_timeout)
+
+    # порядок остановки: доработать обновления, остановить диспетчер, закрыть сессию бота
+    app.on_shutdown.append(drain)
+    setup_application(app, dp, bot=bot)
+    handler.register(app, path=settings.path)
+    return app
+
+
+async def serve_worker(app: web.Application, port: int) -> None:
+    """
+    Запускает обработчик на 127.0.0.1:port до SIGTERM от входного процесса.
+    Остановка — как у web.run_app, но повторный сигнал не прерывает доработку.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await stop.wait()
+    await runner.cleanup()